@@ -1,10 +1,13 @@
 from flask import Flask, request
-from flask_sqlalchemy import SQLAlchemy
 from flask_restx import Api, Resource, fields
+from werkzeug.local import LocalProxy
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
 from functools import wraps
+from shared import admission, metrics, profiling, responses, serving, tracing
+from shared.database import engine_options
+from shared.replicas import RoutingSQLAlchemy
 import os
 import psycopg2
 
@@ -36,7 +39,21 @@ db_name = os.environ.get('POSTGRES_DB', 'accounts_db')
 
 app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 app.config['SECRET_KEY'] = 'your_secret_key'
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+db = RoutingSQLAlchemy(app)
+serving.register_health(app, db)
+metrics.register_metrics(app, db)
+responses.register_responses(app, api)
+profiling.register_profiling(app, api)
+tracing.register_tracing(app, 'accounts')
+# Дорогие операции — хеширование паролей; под перегрузкой они отклоняются первыми
+admission.register_admission(app, classes={
+    ('POST', '/api/Authentication/SignIn'): 'expensive',
+    ('POST', '/api/Authentication/SignUp'): 'expensive',
+    ('PUT', '/api/Accounts/Update'): 'expensive',
+    ('POST', '/api/Accounts'): 'expensive',
+    ('PUT', '/api/Accounts/<int:id>'): 'expensive',
+})
 
 # Модель пользователя
 class User(db.Model):
@@ -123,6 +140,17 @@ finally:
     if conn:
         conn.close()
 
+# Пользователь загружается при первом обращении: обработчикам, которым он не нужен
+# (выход, список врачей), лишний запрос к базе не делается
+def lazy_user(user_id):
+    loaded = []
+
+    def load():
+        if not loaded:
+            loaded.append(User.query.filter_by(id=user_id).first())
+        return loaded[0]
+    return LocalProxy(load)
+
 # Декоратор для проверки JWT токена
 def token_required(f):
     @wraps(f)
@@ -139,7 +167,7 @@ def token_required(f):
 
         try:
             data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
+            current_user = lazy_user(data['user_id'])
         except jwt.ExpiredSignatureError:
             return {'message': 'Token expired'}, 401
         except jwt.InvalidTokenError:
@@ -250,8 +278,10 @@ class RefreshToken(Resource):
             if not user:
                 return {'message': 'User not found'}, 404
             
+            # Роли берутся из базы, как при входе: по ним другие сервисы проверяют права
             new_access_token = jwt.encode({
                 'user_id': user.id,
+                'roles': user.roles.split(','),
                 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
             }, app.config['SECRET_KEY'])
             
@@ -480,7 +510,11 @@ class GetDoctorById(Resource):
         }
         return doctor_data, 200
 
+@serving.on_startup
+def prepare_database():
+    with app.app_context():
+        db.create_all()
+        create_initial_users()
+
 if __name__ == '__main__':
-    db.create_all()
-    create_initial_users()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    serving.run_dev_server(app)
@@ -0,0 +1,48 @@
+"""Helpers shared by the benchmark scripts: timing, percentiles and JSON reports."""
+import json
+import sys
+import time
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, int(round(q / 100.0 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, elapsed=None):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    summary = {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+    if elapsed:
+        summary['throughput_rps'] = round(len(ordered) / elapsed, 2)
+    return summary
+
+
+def measure(fn, repeat):
+    """Run fn() repeat times and return the individual durations in seconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def emit(report, path=None):
+    """Write a report as JSON to path, or to stdout when no path is given."""
+    payload = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if path:
+        with open(path, 'w') as f:
+            f.write(payload + '\n')
+    else:
+        sys.stdout.write(payload + '\n')
@@ -0,0 +1,98 @@
+"""Cost of producing large JSON list responses: flask-restx marshal + json vs the FAST_JSON path.
+
+Builds the dictionaries the services build for a page of --hospitals hospitals
+(HospitalList.get) and for --entries timetable entries (timetable_to_dict) in memory and
+measures, inside a request context of the service:
+
+* marshal_json - flask_restx.marshal with the Swagger model, then the default
+  application/json representation of flask-restx (stdlib json);
+* fast_json    - shared.responses.project on the model keys, then shared.responses.output_json (orjson);
+* gzip / br    - compression of the encoded body as shared.responses.compress_response does it,
+  with the resulting size in bytes.
+
+No database is needed.
+
+    python benchmarks/json_responses.py --hospitals 1000 --entries 10000
+"""
+import argparse
+import datetime
+import os
+import sys
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'hospitals'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'timetable'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+import hospital_service  # noqa: E402
+import timetable_service  # noqa: E402
+from common import emit, measure, summarize  # noqa: E402
+from flask_restx import marshal  # noqa: E402
+from flask_restx.representations import output_json  # noqa: E402
+from shared import responses  # noqa: E402
+
+
+def hospitals(count, rooms):
+    return [{
+        'id': n,
+        'name': f'Hospital {n}',
+        'address': f'Bench street {n}',
+        'contactPhone': f'+7000{n}',
+        'rooms': [f'Room {r}' for r in range(1, rooms + 1)],
+    } for n in range(1, count + 1)]
+
+
+def timetable(count):
+    start = datetime.datetime(2030, 1, 1, 8)
+    return [timetable_service.timetable_to_dict(SimpleNamespace(
+        id=n,
+        hospital_id=1,
+        doctor_id=10 * (1 + n % 100),
+        start_time=start + datetime.timedelta(minutes=30 * n),
+        end_time=start + datetime.timedelta(minutes=30 * n + 30),
+        room=f'Room {1 + n % 10}',
+    )) for n in range(count)]
+
+
+def measure_case(app, data, model, repeat):
+    results = {}
+    with app.test_request_context():
+        cases = {
+            'marshal_json': lambda: output_json(marshal(data, model), 200),
+            'fast_json': lambda: responses.output_json(responses.project(data, model), 200),
+        }
+        for name, produce in cases.items():
+            results[name] = summarize(measure(produce, repeat))
+            results[name]['bytes'] = len(produce().get_data())
+        body = cases['fast_json']().get_data()
+
+    for encoding in ('gzip', 'br') if responses.brotli else ('gzip',):
+        results[encoding] = summarize(measure(lambda: responses.compress(body, encoding), repeat))
+        results[encoding]['bytes'] = len(responses.compress(body, encoding))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hospitals', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=10, help='rooms per hospital')
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = {'benchmark': 'json_responses', 'params': vars(args).copy()}
+    report['params'].pop('output')
+    report['hospital_list'] = measure_case(
+        hospital_service.app, hospitals(args.hospitals, args.rooms), hospital_service.hospital_model, args.repeat
+    )
+    report['timetable'] = measure_case(
+        timetable_service.app, timetable(args.entries), timetable_service.timetable_model, args.repeat
+    )
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
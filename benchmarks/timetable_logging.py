@@ -0,0 +1,108 @@
+"""Compare the request-time cost of timetable logging before and after the logging rework.
+
+Each configuration runs in its own subprocess, because the service configures logging
+at import time from the environment:
+
+* baseline - timetable_service.py as of --baseline-rev (git show), with its own
+  logging.basicConfig(level=DEBUG) and eager f-string messages;
+* default - the current service with the production defaults: INFO, JSON, written by
+  a background queue listener.
+
+The workload exists in both versions: a view behind token_required (token check, no
+database) plus doctor_exists() against an in-process stand-in for the accounts response.
+Log output goes to a real file so the write cost is included.
+
+    python benchmarks/timetable_logging.py --requests 5000
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.join(BENCH_DIR, '..', 'timetable')
+
+# Коммит до переработки логирования
+BASELINE_REV = '68d2b47'
+CONFIGURATIONS = ('baseline', 'default')
+
+
+def worker(requests_count, baseline_dir):
+    sys.path.insert(0, SERVICE_DIR)
+    sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+    sys.path.insert(0, BENCH_DIR)
+    if baseline_dir:
+        sys.path.insert(0, baseline_dir)
+    import jwt
+    import requests
+    import timetable_service
+    from common import summarize
+
+    upstream = requests.models.Response()
+    upstream.status_code = 200
+    upstream._content = json.dumps({'id': 1, 'roles': 'Doctor', 'bio': 'x' * 4000}).encode()
+    timetable_service.requests.get = lambda *args, **kwargs: upstream
+
+    token = jwt.encode({
+        'user_id': 1,
+        'roles': ['Admin'],
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    }, timetable_service.app.config['SECRET_KEY'])
+    headers = {'Authorization': f'Bearer {token}'}
+    protected = timetable_service.token_required(lambda: None)
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(requests_count):
+        request_started = time.perf_counter()
+        with timetable_service.app.test_request_context(headers=headers):
+            protected()
+        timetable_service.doctor_exists(1)
+        samples.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    print(json.dumps(summarize(samples, elapsed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--baseline-rev', default=BASELINE_REV, help='git revision of the baseline service')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--baseline-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.requests, args.baseline_dir)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from common import emit
+
+    report = {'benchmark': 'timetable_logging', 'requests': args.requests, 'baseline_rev': args.baseline_rev}
+    env = {key: value for key, value in os.environ.items() if not key.startswith('LOG_')}
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        source = subprocess.run(['git', 'show', f'{args.baseline_rev}:timetable/timetable_service.py'],
+                                cwd=BENCH_DIR, stdout=subprocess.PIPE, check=True).stdout
+        with open(os.path.join(baseline_dir, 'timetable_service.py'), 'wb') as f:
+            f.write(source)
+        for name in CONFIGURATIONS:
+            command = [sys.executable, os.path.abspath(__file__), '--worker', '--requests', str(args.requests)]
+            if name == 'baseline':
+                command += ['--baseline-dir', baseline_dir]
+            with tempfile.TemporaryFile() as log_file:
+                result = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=log_file, check=True)
+                log_file.seek(0, os.SEEK_END)
+                summary = json.loads(result.stdout.decode().strip().splitlines()[-1])
+                summary['log_bytes'] = log_file.tell()
+            report[name] = summary
+
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,122 @@
-from flask import Flask, request
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, request, send_file, stream_with_context
 from flask_restx import Api, Resource, fields
-from datetime import datetime
-import jwt
+from sqlalchemy import Integer, create_engine, delete, func, literal, select, text, true, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, insert as pg_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from shared import admission, metrics, profiling, responses, serving, tracing
+from shared.database import engine_options
+from shared.idempotency import IdempotencyStore
+from shared.replicas import RoutingSQLAlchemy
+from shared.jobs import JobRunner
+import base64
+import bisect
+import click
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd-сжатие экспорта доступно только при установленном zstandard
+    zstandard = None
 
 app = Flask(__name__)
 api = Api(app, title="Documents API", description="API for managing medical visit history", version="1.0")
 app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://user:password@db/documents_db'
 app.config['SECRET_KEY'] = 'your_secret_key'
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+db = RoutingSQLAlchemy(app)
+
+# Размер страницы истории посещений по умолчанию и максимальный
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '100'))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', '1000'))
+
+# Пакетное чтение истории: максимум id или пациентов в одном запросе и число последних
+# записей на пациента по умолчанию
+HISTORY_BATCH_MAX_IDS = int(os.environ.get('HISTORY_BATCH_MAX_IDS', '1000'))
+HISTORY_BATCH_PER_PACIENT = int(os.environ.get('HISTORY_BATCH_PER_PACIENT', '10'))
+
+# Конфигурация полнотекстового поиска по History.data. Колонка search_vector вычисляется
+# базой при вставке и обновлении; смена конфигурации требует пересоздания колонки.
+HISTORY_SEARCH_CONFIG = os.environ.get('HISTORY_SEARCH_CONFIG', 'russian')
+HISTORY_SEARCH_VECTOR_SQL = f"to_tsvector('{HISTORY_SEARCH_CONFIG}'::regconfig, data)"
+
+# Массовая загрузка истории: строк в одной пачке COPY и максимум ошибок, возвращаемых в ответе
+BULK_BATCH_SIZE = int(os.environ.get('HISTORY_BULK_BATCH_SIZE', '10000'))
+BULK_MAX_ERRORS = int(os.environ.get('HISTORY_BULK_MAX_ERRORS', '1000'))
+BULK_FIELDS = ('date', 'pacientId', 'hospitalId', 'doctorId', 'room', 'data')
+# Границы колонок integer: значения вне них COPY отвергает вместе со всей пачкой
+BULK_INT_MIN, BULK_INT_MAX = -2 ** 31, 2 ** 31 - 1
+HISTORY_COPY_SQL = 'COPY history (date, pacient_id, hospital_id, doctor_id, room, data) FROM STDIN WITH (FORMAT csv)'
+# Сколько часов шард помнит номера записей массовой загрузки (см. HistoryBulkRecord)
+BULK_UPLOAD_TTL_HOURS = float(os.environ.get('HISTORY_BULK_UPLOAD_TTL_HOURS', '24'))
+
+# Экспорт истории: размер пачки серверного курсора, каталог и срок хранения файлов
+# фоновых экспортов (в часах), число обработчиков фоновых задач (экспортов) в процессе
+EXPORT_BATCH_SIZE = int(os.environ.get('HISTORY_EXPORT_BATCH_SIZE', '2000'))
+EXPORT_DIR = os.environ.get('HISTORY_EXPORT_DIR', '/tmp/history_exports')
+EXPORT_TTL_HOURS = float(os.environ.get('HISTORY_EXPORT_TTL_HOURS', '24'))
+EXPORT_WORKERS = int(os.environ.get('HISTORY_EXPORT_WORKERS', os.environ.get('JOB_WORKERS', '2')))
+EXPORT_COMPRESSIONS = {
+    'gzip': ('application/gzip', '.jsonl.gz'),
+    'zstd': ('application/zstd', '.jsonl.zst'),
+}
+
+# Секционирование истории по месяцам даты посещения: включение, на сколько месяцев вперёд
+# создавать секции, через сколько месяцев архивировать (0 — не архивировать автоматически),
+# куда архивировать (табличное пространство или каталог сжатых файлов) и период обслуживания
+HISTORY_PARTITIONING = os.environ.get('HISTORY_PARTITIONING', 'false').lower() in ('1', 'true', 'yes')
+PARTITION_MONTHS_AHEAD = int(os.environ.get('HISTORY_PARTITION_MONTHS_AHEAD', '3'))
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('HISTORY_ARCHIVE_AFTER_MONTHS', '0'))
+ARCHIVE_TABLESPACE = os.environ.get('HISTORY_ARCHIVE_TABLESPACE')
+ARCHIVE_DIR = os.environ.get('HISTORY_ARCHIVE_DIR', '/var/lib/documents/history_archive')
+PARTITION_MAINTENANCE_HOURS = float(os.environ.get('HISTORY_PARTITION_MAINTENANCE_HOURS', '24'))
+PARTITION_NAME_PATTERN = re.compile(r'^history_p(\d{4})(\d{2})$')
+
+# Вложения к записям истории: каталог хранилища, максимальный размер файла и размер
+# блока чтения потока загрузки. Файлы адресуются по SHA-256 содержимого, одинаковые
+# файлы хранятся один раз.
+ATTACHMENTS_DIR = os.environ.get('HISTORY_ATTACHMENTS_DIR', '/var/lib/documents/attachments')
+ATTACHMENT_MAX_BYTES = int(os.environ.get('HISTORY_ATTACHMENT_MAX_BYTES', str(512 * 1024 * 1024)))
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
+# Шардирование истории по pacient_id: список баз через запятую (url или имя=url). Пустой
+# список — история хранится в основной базе. На время перебалансировки в HISTORY_SHARDS_PREVIOUS
+# указывается прежний список: записи пациента ищутся и у нового, и у прежнего владельца.
+HISTORY_SHARDS = os.environ.get('HISTORY_SHARDS', '')
+HISTORY_SHARDS_PREVIOUS = os.environ.get('HISTORY_SHARDS_PREVIOUS', '')
+HISTORY_SHARD_VNODES = int(os.environ.get('HISTORY_SHARD_VNODES', '64'))
+HISTORY_SHARD_WORKERS = int(os.environ.get('HISTORY_SHARD_WORKERS', '8'))
+REBALANCE_BATCH_SIZE = int(os.environ.get('HISTORY_REBALANCE_BATCH_SIZE', '1000'))
+HISTORY_COLUMNS = ('id', 'date', 'pacient_id', 'hospital_id', 'doctor_id', 'room', 'data')
+HISTORY_BULK_STAGING_SQL = (
+    'CREATE TEMP TABLE history_bulk_staging (record integer, id integer, date timestamp, pacient_id integer, '
+    'hospital_id integer, doctor_id integer, room varchar(50), data varchar(500)) ON COMMIT DROP'
+)
+HISTORY_BULK_STAGING_COPY_SQL = (
+    'COPY history_bulk_staging (record, id, date, pacient_id, hospital_id, doctor_id, room, data) FROM STDIN WITH (FORMAT csv)'
+)
+# В history попадают только записи, номера которых загрузка ещё не сохраняла на этом шарде
+HISTORY_BULK_CLAIM_SQL = (
+    'WITH claimed AS ('
+    'INSERT INTO history_bulk_record (upload_id, record) SELECT %s, record FROM history_bulk_staging '
+    'ON CONFLICT DO NOTHING RETURNING record) '
+    'INSERT INTO history (id, date, pacient_id, hospital_id, doctor_id, room, data) '
+    'SELECT s.id, s.date, s.pacient_id, s.hospital_id, s.doctor_id, s.room, s.data '
+    'FROM history_bulk_staging s JOIN claimed USING (record)'
+)
 
 # Модель для хранения истории посещений
 class History(db.Model):
@@ -19,6 +127,187 @@ class History(db.Model):
     doctor_id = db.Column(db.Integer, nullable=False)
     room = db.Column(db.String(50), nullable=False)
     data = db.Column(db.String(500), nullable=False)
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(HISTORY_SEARCH_VECTOR_SQL, persisted=True)))
+
+    # Индексы под постраничную выдачу истории пациента, врача и больницы в порядке (date, id)
+    # и GIN-индекс полнотекстового поиска
+    __table_args__ = (
+        db.Index('ix_history_pacient_date', 'pacient_id', 'date', 'id'),
+        db.Index('ix_history_doctor_date', 'doctor_id', 'date', 'id'),
+        db.Index('ix_history_hospital_date', 'hospital_id', 'date', 'id'),
+        db.Index('ix_history_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+
+# Номера записей массовой загрузки, сохранённые на шарде. Пачка фиксируется на шардах
+# отдельными транзакциями; повтор загрузки с тем же uploadId пропускает уже сохранённые
+# записи, поэтому сбой одного шарда не приводит к дублям на других
+class HistoryBulkRecord(db.Model):
+    __tablename__ = 'history_bulk_record'
+    upload_id = db.Column(db.String(64), primary_key=True)
+    record = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), index=True)
+
+# Секции истории, выгруженные в сжатые файлы
+class HistoryArchive(db.Model):
+    __tablename__ = 'history_archive'
+    partition = db.Column(db.String(63), primary_key=True)
+    range_from = db.Column(db.Date, nullable=False)
+    range_to = db.Column(db.Date, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    min_id = db.Column(db.Integer)
+    max_id = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+# Где лежит каждая архивная запись: файл секции и смещение gzip-блока (в блоке до
+# EXPORT_BATCH_SIZE строк), с которого начинается чтение при обращении к архиву
+class HistoryArchiveEntry(db.Model):
+    __tablename__ = 'history_archive_entry'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    partition = db.Column(db.String(63), nullable=False, index=True)
+    file_offset = db.Column(db.BigInteger, nullable=False)
+
+# Вложение к записи истории; содержимое лежит в хранилище по sha256
+class Attachment(db.Model):
+    __tablename__ = 'history_attachment'
+    id = db.Column(db.Integer, primary_key=True)
+    history_id = db.Column(db.Integer, nullable=False, index=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+# Сохранённые ответы запросов с заголовком Idempotency-Key
+idempotency = IdempotencyStore(db, error=lambda code, message: ({'message': message}, code))
+
+# Шард истории — отдельная база со своей схемой history
+class HistoryShard:
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+
+    def __repr__(self):
+        return f'<HistoryShard {self.name}>'
+
+def shard_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+# Консистентное хэширование: у каждого шарда HISTORY_SHARD_VNODES точек на кольце, ключ
+# принадлежит ближайшей точке по часовой стрелке. При добавлении шарда переезжает лишь
+# около 1/N пациентов.
+class HashRing:
+    def __init__(self, names, vnodes=HISTORY_SHARD_VNODES):
+        points = sorted((shard_hash(f'{name}#{i}'), name) for name in names for i in range(vnodes))
+        self.points = [point for point, name in points]
+        self.names = [name for point, name in points]
+
+    def lookup(self, key):
+        index = bisect.bisect(self.points, shard_hash(str(key))) % len(self.points)
+        return self.names[index]
+
+# Имя шарда задаётся явно (имя=url) или берётся из url как host/database, чтобы положение
+# на кольце не зависело от пароля и порядка в списке
+def parse_history_shards(value):
+    shards = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, url = item.partition('=')
+        if not separator or '://' in name:
+            name, url = None, item
+        if name is None:
+            parsed = make_url(url)
+            name = f'{parsed.host}/{parsed.database}' if parsed.host else parsed.database
+        shards.append((name, url))
+    return shards
+
+history_ring = None
+previous_history_ring = None
+history_shards = {}
+for name, url in parse_history_shards(HISTORY_SHARDS_PREVIOUS) + parse_history_shards(HISTORY_SHARDS):
+    if name not in history_shards:
+        history_shards[name] = HistoryShard(name, create_engine(url, **engine_options(url)))
+if HISTORY_SHARDS:
+    history_ring = HashRing([name for name, url in parse_history_shards(HISTORY_SHARDS)])
+if HISTORY_SHARDS_PREVIOUS:
+    previous_history_ring = HashRing([name for name, url in parse_history_shards(HISTORY_SHARDS_PREVIOUS)])
+shard_executor = ThreadPoolExecutor(max_workers=HISTORY_SHARD_WORKERS, thread_name_prefix='history-shard')
+
+# Движки процесса для проверок готовности и метрик пулов
+def service_engines():
+    return {**db.service_engines(), **{name: shard.engine for name, shard in history_shards.items()}}
+
+serving.register_health(app, db, engines=service_engines)
+metrics.register_metrics(app, db, engines=service_engines)
+responses.register_responses(app, api)
+profiling.register_profiling(app, api)
+tracing.register_tracing(app, 'documents')
+# Дорогие операции — полнотекстовый поиск, массовая загрузка, потоковый экспорт и вложения
+admission.register_admission(app, classes={
+    ('GET', '/api/History/Search'): 'expensive',
+    ('POST', '/api/History/Bulk'): 'expensive',
+    ('GET', '/api/History/Export'): 'expensive',
+    ('POST', '/api/History/<int:id>/Attachments'): 'expensive',
+})
+
+def pacient_shard(pacient_id):
+    return history_shards[history_ring.lookup(pacient_id)]
+
+# Шарды, где могут лежать записи пациента: владелец по текущему кольцу и, пока идёт
+# перебалансировка, владелец по прежнему
+def pacient_shards(pacient_id):
+    shards = [pacient_shard(pacient_id)]
+    if previous_history_ring:
+        previous = history_shards[previous_history_ring.lookup(pacient_id)]
+        if previous is not shards[0]:
+            shards.append(previous)
+    return shards
+
+# Выполнение fn(session) на каждом шарде параллельно; результаты в порядке шардов
+def query_shards(shards, fn):
+    def run(shard):
+        with Session(shard.engine) as session:
+            return fn(session)
+    if len(shards) == 1:
+        return [run(shards[0])]
+    return list(shard_executor.map(run, shards))
+
+# Слияние результатов шардов без дублей по id (во время переноса запись может оказаться
+# на двух шардах сразу)
+def merge_shard_rows(results, history_of=lambda row: row):
+    merged = {}
+    for rows in results:
+        for row in rows:
+            merged.setdefault(history_of(row).id, row)
+    return list(merged.values())
+
+# Новые id берутся из общей последовательности основной базы, поэтому они уникальны
+# между шардами и не меняются при переносе записи
+def next_history_ids(count):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            text("SELECT nextval('history_global_id_seq') FROM generate_series(1, :count)"), {'count': count}
+        ).scalars().all()
+
+# Шард, на котором лежит запись с данным id
+def locate_history(id):
+    shards = list(history_shards.values())
+    found = query_shards(shards, lambda session: session.query(History.id).filter(History.id == id).first())
+    for shard, row in zip(shards, found):
+        if row:
+            return shard
+    return None
+
+# Запись по id в основной базе или на шардах
+def get_history(id):
+    if not history_shards:
+        return History.query.get(id)
+    for history in query_shards(list(history_shards.values()), lambda session: session.get(History, id)):
+        if history:
+            return history
+    return None
 
 # Swagger модели для истории посещений
 history_model = api.model('History', {
@@ -30,27 +319,484 @@ history_model = api.model('History', {
     'data': fields.String(required=True, description='Details about the visit')
 })
 
+# Параметры постраничной выдачи истории
+history_page_parser = api.parser()
+history_page_parser.add_argument('limit', type=int, location='args', help='Page size')
+history_page_parser.add_argument('cursor', type=str, location='args', help='Value of X-Next-Cursor from the previous page')
+history_page_parser.add_argument('fromDate', type=str, location='args', help='Only visits on or after this ISO date')
+history_page_parser.add_argument('toDate', type=str, location='args', help='Only visits on or before this ISO date')
+
+class InvalidHistoryRequest(ValueError):
+    pass
+
+def history_to_dict(history):
+    return {
+        'id': history.id,
+        'date': history.date.isoformat(),
+        'pacientId': history.pacient_id,
+        'hospitalId': history.hospital_id,
+        'doctorId': history.doctor_id,
+        'room': history.room,
+        'data': history.data
+    }
+
+# Курсор страницы — (date, id) последней выданной записи в base64
+def encode_cursor(history):
+    raw = f'{history.date.isoformat()}|{history.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        date, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(date), int(id)
+    except ValueError:
+        raise InvalidHistoryRequest('Invalid cursor')
+
+def parse_id_list(value, name):
+    try:
+        ids = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise InvalidHistoryRequest(f'{name} must be a comma-separated list of integers')
+    if not ids:
+        raise InvalidHistoryRequest(f'{name} is required')
+    if len(ids) > HISTORY_BATCH_MAX_IDS:
+        raise InvalidHistoryRequest(f'At most {HISTORY_BATCH_MAX_IDS} {name} per request')
+    return list(dict.fromkeys(ids))
+
+def parse_history_date(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidHistoryRequest(f'Invalid {name}. Use ISO format')
+
+# Страница истории по условию в порядке (date, id) с продолжением по ключу, а не по смещению,
+# поэтому каждая страница — один проход по индексу (column, date, id). При шардировании
+# история пациента читается с его шарда, остальные выборки — со всех шардов параллельно;
+# каждый шард отдаёт limit + 1 строк, их слияние по (date, id) даёт ту же страницу.
+def paginate_history(condition, pacient_id=None):
+    args = history_page_parser.parse_args()
+    limit = min(max(args.get('limit') or HISTORY_PAGE_SIZE, 1), HISTORY_MAX_PAGE_SIZE)
+
+    conditions = [condition]
+    if args.get('fromDate'):
+        conditions.append(History.date >= parse_history_date(args['fromDate'], 'fromDate'))
+    if args.get('toDate'):
+        conditions.append(History.date <= parse_history_date(args['toDate'], 'toDate'))
+    if args.get('cursor'):
+        after_date, after_id = decode_cursor(args['cursor'])
+        conditions.append(tuple_(History.date, History.id) > tuple_(after_date, after_id))
+
+    if history_shards:
+        shards = pacient_shards(pacient_id) if pacient_id is not None else list(history_shards.values())
+        results = query_shards(shards, lambda session: session.query(History).filter(*conditions)
+                               .order_by(History.date, History.id).limit(limit + 1).all())
+        histories = sorted(merge_shard_rows(results), key=lambda history: (history.date, history.id))[:limit + 1]
+    else:
+        histories = History.query.filter(*conditions).order_by(History.date, History.id).limit(limit + 1).all()
+    headers = {}
+    if len(histories) > limit:
+        histories = histories[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(histories[-1])
+    return histories, headers, bool(args.get('cursor'))
+
+def history_page_response(condition, pacient_id=None):
+    try:
+        histories, headers, is_continuation = paginate_history(condition, pacient_id)
+    except InvalidHistoryRequest as e:
+        return {'message': str(e)}, 400
+    if not histories and not is_continuation:
+        return {'message': 'No history found'}, 404
+    return [history_to_dict(history) for history in histories], 200, headers
+
+# Параметры полнотекстового поиска
+history_search_parser = api.parser()
+history_search_parser.add_argument('query', type=str, location='args', required=True, help='Search terms, web search syntax ("quoted phrase", or, -excluded)')
+history_search_parser.add_argument('pacientId', type=int, location='args', help='Patient ID')
+history_search_parser.add_argument('doctorId', type=int, location='args', help='Doctor ID')
+history_search_parser.add_argument('hospitalId', type=int, location='args', help='Hospital ID')
+history_search_parser.add_argument('limit', type=int, location='args', help='Page size')
+history_search_parser.add_argument('offset', type=int, location='args', default=0, help='Value of X-Next-Offset from the previous page')
+
+# Параметры пакетного чтения
+history_batch_parser = api.parser()
+history_batch_parser.add_argument('ids', type=str, location='args', required=True, help='Comma-separated history IDs')
+
+history_accounts_parser = api.parser()
+history_accounts_parser.add_argument('pacientIds', type=str, location='args', required=True, help='Comma-separated patient IDs')
+history_accounts_parser.add_argument('limit', type=int, location='args', help='Most recent visits per patient')
+
+# Параметры массовой загрузки
+history_bulk_parser = api.parser()
+history_bulk_parser.add_argument('format', type=str, location='args', choices=('ndjson', 'csv'), help='Body format; defaults to csv for text/csv, ndjson otherwise')
+history_bulk_parser.add_argument('offset', type=int, location='args', default=0, help='Skip this many records, e.g. committedOffset of an interrupted upload')
+history_bulk_parser.add_argument('uploadId', type=str, location='args', help='uploadId of an interrupted upload when resuming it')
+
+# Параметры экспорта истории
+history_export_parser = api.parser()
+history_export_parser.add_argument('pacientIds', type=str, location='args', help='Comma-separated patient IDs')
+history_export_parser.add_argument('hospitalId', type=int, location='args', help='Hospital ID')
+history_export_parser.add_argument('fromDate', type=str, location='args', help='Only visits on or after this ISO date')
+history_export_parser.add_argument('toDate', type=str, location='args', help='Only visits on or before this ISO date')
+history_export_parser.add_argument('compression', type=str, location='args', choices=tuple(EXPORT_COMPRESSIONS), default='gzip', help='gzip or zstd')
+
+history_export_model = api.model('HistoryExportRequest', {
+    'pacientIds': fields.List(fields.Integer, description='Patient IDs'),
+    'hospitalId': fields.Integer(description='Hospital ID'),
+    'fromDate': fields.String(description='Only visits on or after this ISO date'),
+    'toDate': fields.String(description='Only visits on or before this ISO date'),
+    'compression': fields.String(description='gzip or zstd', enum=list(EXPORT_COMPRESSIONS), default='gzip')
+})
+
 # Получение истории посещений по аккаунту
 @api.route('/api/History/Account/<int:id>')
 class GetHistoryByAccount(Resource):
+    @api.expect(history_page_parser)
     @api.response(200, 'Success')
+    @api.response(400, 'Invalid cursor or date')
     @api.response(404, 'No history found')
     def get(self, id):
-        """Get medical visit history by patient ID"""
-        histories = History.query.filter_by(pacient_id=id).all()
-        if not histories:
-            return {'message': 'No history found'}, 404
+        """Get medical visit history by patient ID, one page at a time"""
+        return history_page_response(History.pacient_id == id, pacient_id=id)
+
+# Получение истории посещений по врачу
+@api.route('/api/History/Doctor/<int:id>')
+class GetHistoryByDoctor(Resource):
+    @api.expect(history_page_parser)
+    @api.response(200, 'Success')
+    @api.response(400, 'Invalid cursor or date')
+    @api.response(404, 'No history found')
+    def get(self, id):
+        """Get medical visit history by doctor ID, one page at a time"""
+        return history_page_response(History.doctor_id == id)
+
+# Получение истории посещений по больнице
+@api.route('/api/History/Hospital/<int:id>')
+class GetHistoryByHospital(Resource):
+    @api.expect(history_page_parser)
+    @api.response(200, 'Success')
+    @api.response(400, 'Invalid cursor or date')
+    @api.response(404, 'No history found')
+    def get(self, id):
+        """Get medical visit history by hospital ID, one page at a time"""
+        return history_page_response(History.hospital_id == id)
+
+# Полнотекстовый поиск по записям посещений
+@api.route('/api/History/Search')
+class SearchHistory(Resource):
+    @api.expect(history_search_parser)
+    @api.response(200, 'Success')
+    def get(self):
+        """Search visit notes, best matches first"""
+        args = history_search_parser.parse_args()
+        limit = min(max(args.get('limit') or HISTORY_PAGE_SIZE, 1), HISTORY_MAX_PAGE_SIZE)
+        offset = max(args.get('offset') or 0, 0)
+
+        tsquery = func.websearch_to_tsquery(HISTORY_SEARCH_CONFIG, args['query'])
+        rank = func.ts_rank_cd(History.search_vector, tsquery)
+        conditions = [History.search_vector.op('@@')(tsquery)]
+        if args.get('pacientId') is not None:
+            conditions.append(History.pacient_id == args['pacientId'])
+        if args.get('doctorId') is not None:
+            conditions.append(History.doctor_id == args['doctorId'])
+        if args.get('hospitalId') is not None:
+            conditions.append(History.hospital_id == args['hospitalId'])
+
+        def search(session, offset, limit):
+            return session.query(History, rank.label('rank')).filter(*conditions) \
+                .order_by(rank.desc(), History.id.desc()).offset(offset).limit(limit).all()
+
+        if history_shards:
+            # Каждый шард отдаёт первые offset + limit + 1 совпадений, смещение применяется после слияния
+            if args.get('pacientId') is not None:
+                shards = pacient_shards(args['pacientId'])
+            else:
+                shards = list(history_shards.values())
+            results = merge_shard_rows(
+                query_shards(shards, lambda session: search(session, 0, offset + limit + 1)),
+                history_of=lambda row: row[0]
+            )
+            results.sort(key=lambda row: (row[1], row[0].id), reverse=True)
+            results = results[offset:offset + limit + 1]
+        else:
+            results = search(db.session, offset, limit + 1)
+        headers = {}
+        if len(results) > limit:
+            results = results[:limit]
+            headers['X-Next-Offset'] = str(offset + limit)
 
         output = []
-        for history in histories:
-            output.append({
-                'date': history.date.isoformat(),
-                'hospitalId': history.hospital_id,
-                'doctorId': history.doctor_id,
-                'room': history.room,
-                'data': history.data
-            })
-        return output, 200
+        for history, score in results:
+            item = history_to_dict(history)
+            item['rank'] = score
+            output.append(item)
+        return output, 200, headers
+
+def history_rows_by_id(session, ids):
+    columns = [History.__table__.c[column] for column in HISTORY_COLUMNS]
+    return session.execute(select(*columns).where(History.id.in_(ids))).all()
+
+# Последние limit записей каждого пациента одним запросом: LATERAL-подзапрос по каждому
+# элементу unnest(pacient_ids) читает свой диапазон индекса (pacient_id, date, id) с конца
+# и останавливается на limit строках, не перебирая всю историю пациента
+def recent_history_rows(session, pacient_ids, limit):
+    pacients = select(func.unnest(literal(pacient_ids, ARRAY(Integer))).label('pacient_id')).subquery('pacients')
+    columns = [History.__table__.c[column] for column in HISTORY_COLUMNS]
+    recent = select(*columns).where(History.pacient_id == pacients.c.pacient_id) \
+        .order_by(History.date.desc(), History.id.desc()).limit(limit).lateral('recent')
+    return session.execute(select(recent).select_from(pacients.join(recent, true()))).all()
+
+# Получение нескольких записей истории по списку id
+@api.route('/api/History/Batch')
+class GetHistoryBatch(Resource):
+    @api.expect(history_batch_parser)
+    @api.response(200, 'Found records in the requested order and the IDs that were not found')
+    @api.response(400, 'Invalid ids')
+    def get(self):
+        """Get many history records by ID in one request"""
+        args = history_batch_parser.parse_args()
+        try:
+            ids = parse_id_list(args['ids'], 'ids')
+        except InvalidHistoryRequest as e:
+            return {'message': str(e)}, 400
+
+        if history_shards:
+            rows = merge_shard_rows(query_shards(list(history_shards.values()), lambda session: history_rows_by_id(session, ids)))
+        else:
+            rows = history_rows_by_id(db.session, ids)
+        found = {row.id: history_to_dict(row) for row in rows}
+        found.update(find_archived_histories([id for id in ids if id not in found]))
+        return {
+            'histories': [found[id] for id in ids if id in found],
+            'missing': [id for id in ids if id not in found]
+        }, 200
+
+# Последние посещения нескольких пациентов, сгруппированные по пациенту
+@api.route('/api/History/Accounts')
+class GetHistoryByAccounts(Resource):
+    @api.expect(history_accounts_parser)
+    @api.response(200, 'One group per requested patient, most recent visits first')
+    @api.response(400, 'Invalid pacientIds or limit')
+    def get(self):
+        """Get the most recent visits of many patients in one request"""
+        args = history_accounts_parser.parse_args()
+        limit = min(max(args.get('limit') or HISTORY_BATCH_PER_PACIENT, 1), HISTORY_MAX_PAGE_SIZE)
+        try:
+            pacient_ids = parse_id_list(args['pacientIds'], 'pacientIds')
+        except InvalidHistoryRequest as e:
+            return {'message': str(e)}, 400
+
+        if history_shards:
+            shards = {}
+            ids_by_engine = {}
+            for pacient_id in pacient_ids:
+                for shard in pacient_shards(pacient_id):
+                    shards[shard.name] = shard
+                    ids_by_engine.setdefault(shard.engine, []).append(pacient_id)
+            rows = merge_shard_rows(query_shards(list(shards.values()), lambda session: recent_history_rows(
+                session, ids_by_engine[session.bind], limit)))
+        else:
+            rows = recent_history_rows(db.session, pacient_ids, limit)
+
+        groups = {pacient_id: [] for pacient_id in pacient_ids}
+        for row in sorted(rows, key=lambda row: (row.date, row.id), reverse=True):
+            if len(groups[row.pacient_id]) < limit:
+                groups[row.pacient_id].append(history_to_dict(row))
+        return [{'pacientId': pacient_id, 'histories': histories} for pacient_id, histories in groups.items()], 200
+
+# Проверка параметров экспорта (из строки запроса или тела) и сборка условий выборки
+def export_filters(params):
+    pacient_ids = params.get('pacientIds')
+    if isinstance(pacient_ids, str) and pacient_ids.strip():
+        pacient_ids = parse_id_list(pacient_ids, 'pacientIds')
+    if not pacient_ids and params.get('hospitalId') is None:
+        raise InvalidHistoryRequest('pacientIds or hospitalId is required')
+    compression = params.get('compression') or 'gzip'
+    if compression not in EXPORT_COMPRESSIONS:
+        raise InvalidHistoryRequest('compression must be gzip or zstd')
+    if compression == 'zstd' and zstandard is None:
+        raise InvalidHistoryRequest('zstd compression is not available on this server')
+
+    conditions = []
+    if pacient_ids:
+        conditions.append(History.pacient_id.in_(pacient_ids))
+    if params.get('hospitalId') is not None:
+        conditions.append(History.hospital_id == params['hospitalId'])
+    if params.get('fromDate'):
+        conditions.append(History.date >= parse_history_date(params['fromDate'], 'fromDate'))
+    if params.get('toDate'):
+        conditions.append(History.date <= parse_history_date(params['toDate'], 'toDate'))
+    return conditions, compression
+
+def export_rows(session, conditions):
+    return session.query(
+        History.id, History.date, History.pacient_id, History.hospital_id,
+        History.doctor_id, History.room, History.data
+    ).filter(*conditions).order_by(History.pacient_id, History.date, History.id).yield_per(EXPORT_BATCH_SIZE)
+
+# Строки JSON Lines экспорта, прочитанные пачками через серверный курсор.
+# Шарды выгружаются по очереди; история каждого пациента лежит на одном шарде,
+# поэтому записи пациента в выгрузке по-прежнему идут подряд.
+def iter_history_export(conditions):
+    buffer = []
+    for session in history_export_sessions():
+        for row in export_rows(session, conditions):
+            buffer.append(json.dumps(history_to_dict(row), ensure_ascii=False) + '\n')
+            if len(buffer) >= EXPORT_BATCH_SIZE:
+                yield ''.join(buffer), len(buffer)
+                buffer = []
+    if buffer:
+        yield ''.join(buffer), len(buffer)
+
+def history_export_sessions():
+    if not history_shards:
+        yield db.session
+        return
+    for shard in history_shards.values():
+        with Session(shard.engine) as session:
+            yield session
+
+# Потоковое сжатие: на выходе куски gzip или zstd по мере поступления данных
+def compress_export(chunks, compression):
+    if compression == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Фоновые задачи сервиса; состояние любой задачи — GET /api/Jobs/<job_id>
+jobs = JobRunner(app, db, workers=EXPORT_WORKERS)
+jobs.register_routes(api)
+
+# Фоновые экспорты выполняются как задачи jobs, файлы лежат в EXPORT_DIR
+EXPORT_JOB_STATUSES = {'queued': 'pending'}
+
+def export_path(export_id, compression):
+    return os.path.join(EXPORT_DIR, export_id + EXPORT_COMPRESSIONS[compression][1])
+
+def export_status(job):
+    result = job['result'] or {}
+    return {
+        'exportId': job['jobId'],
+        'status': EXPORT_JOB_STATUSES.get(job['status'], job['status']),
+        'rows': result.get('rows', job['progressDone']),
+        'size': result.get('size'),
+        'error': job['error'],
+        'createdAt': job['createdAt']
+    }
+
+def find_export(export_id):
+    job = jobs.status(export_id)
+    return job if job and job['kind'] == 'history_export' else None
+
+def remove_expired_exports():
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    expired_before = time.time() - EXPORT_TTL_HOURS * 3600
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < expired_before:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+@jobs.task('history_export')
+def run_history_export(job, params):
+    conditions, compression = export_filters(params)
+    path = export_path(job.id, compression)
+    partial_path = path + '.partial'
+    rows = 0
+
+    def counted_chunks():
+        nonlocal rows
+        for chunk, count in iter_history_export(conditions):
+            rows += count
+            job.progress(rows)
+            yield chunk
+
+    try:
+        with open(partial_path, 'wb') as f:
+            for data in compress_export(counted_chunks(), compression):
+                f.write(data)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return {'rows': rows, 'size': os.path.getsize(path), 'compression': compression}
+
+# Экспорт истории посещений
+@api.route('/api/History/Export')
+class ExportHistory(Resource):
+    @api.expect(history_export_parser)
+    @api.response(200, 'Compressed JSON Lines stream')
+    @api.response(400, 'Invalid export parameters')
+    def get(self):
+        """Stream visit history of one or many patients as compressed JSON Lines"""
+        args = history_export_parser.parse_args()
+        try:
+            conditions, compression = export_filters(args)
+        except InvalidHistoryRequest as e:
+            return {'message': str(e)}, 400
+
+        mimetype, extension = EXPORT_COMPRESSIONS[compression]
+        chunks = (chunk for chunk, rows in iter_history_export(conditions))
+        return Response(
+            stream_with_context(compress_export(chunks, compression)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=history{extension}'}
+        )
+
+    @api.expect(history_export_model)
+    @api.response(202, 'Export scheduled')
+    @api.response(400, 'Invalid export parameters')
+    def post(self):
+        """Schedule a background export and return its handle"""
+        params = request.get_json() or {}
+        try:
+            export_filters(params)
+        except InvalidHistoryRequest as e:
+            return {'message': str(e)}, 400
+
+        remove_expired_exports()
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        job = jobs.submit('history_export', params)
+        return export_status(job), 202, {'Location': f'/api/History/Export/{job["jobId"]}'}
+
+# Состояние фонового экспорта
+@api.route('/api/History/Export/<string:export_id>')
+class ExportHistoryStatus(Resource):
+    @api.response(200, 'Success')
+    @api.response(404, 'Export not found')
+    def get(self, export_id):
+        """Get the status of a background export"""
+        job = find_export(export_id)
+        if not job:
+            return {'message': 'Export not found'}, 404
+        return export_status(job), 200
+
+# Скачивание результата фонового экспорта
+@api.route('/api/History/Export/<string:export_id>/Download')
+class ExportHistoryDownload(Resource):
+    @api.response(200, 'Compressed JSON Lines file')
+    @api.response(404, 'Export not found')
+    @api.response(409, 'Export is not finished')
+    def get(self, export_id):
+        """Download the file of a finished background export"""
+        job = find_export(export_id)
+        if not job:
+            return {'message': 'Export not found'}, 404
+        if job['status'] != 'done':
+            return {'message': 'Export is not finished'}, 409
+        compression = job['result']['compression']
+        path = export_path(export_id, compression)
+        if not os.path.exists(path):
+            return {'message': 'Export not found'}, 404
+        mimetype, extension = EXPORT_COMPRESSIONS[compression]
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name='history' + extension)
 
 # Получение подробной информации по истории посещения
 @api.route('/api/History/<int:id>')
@@ -59,35 +805,406 @@ class GetHistoryById(Resource):
     @api.response(404, 'No history found')
     def get(self, id):
         """Get visit history details by history ID"""
-        history = History.query.get(id)
-        if not history:
+        history = get_history(id)
+        if history:
+            return history_to_dict(history), 200
+
+        archived = find_archived_history(id)
+        if not archived:
             return {'message': 'No history found'}, 404
+        return archived, 200
 
-        return {
-            'date': history.date.isoformat(),
-            'hospitalId': history.hospital_id,
-            'doctorId': history.doctor_id,
-            'room': history.room,
-            'data': history.data
-        }, 200
+# Параметры загрузки вложения
+attachment_upload_parser = api.parser()
+attachment_upload_parser.add_argument('filename', type=str, location='args', required=True, help='Original file name')
+
+attachment_model = api.model('Attachment', {
+    'id': fields.Integer(description='Attachment ID'),
+    'historyId': fields.Integer(description='History record ID'),
+    'filename': fields.String(description='Original file name'),
+    'contentType': fields.String(description='MIME type'),
+    'size': fields.Integer(description='Size in bytes'),
+    'sha256': fields.String(description='SHA-256 of the content')
+})
+
+def attachment_to_dict(attachment):
+    return {
+        'id': attachment.id,
+        'historyId': attachment.history_id,
+        'filename': attachment.filename,
+        'contentType': attachment.content_type,
+        'size': attachment.size,
+        'sha256': attachment.sha256
+    }
+
+# Путь к содержимому в хранилище: ab/cd/abcd...
+def attachment_path(sha256):
+    return os.path.join(ATTACHMENTS_DIR, sha256[:2], sha256[2:4], sha256)
+
+class AttachmentTooLarge(Exception):
+    pass
+
+# Потоковая запись тела запроса во временный файл с подсчётом хэша
+def receive_attachment(stream):
+    tmp_dir = os.path.join(ATTACHMENTS_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(ATTACHMENT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge()
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest(), size, tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Перенос содержимого на место по хэшу и удаление содержимого без ссылок выполняются под
+# транзакционной advisory-блокировкой по хэшу: иначе удаление последнего вложения могло бы
+# стереть файл, на который в это время сослалась загрузка того же содержимого
+def lock_attachment_content(sha256):
+    db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:sha256))'), {'sha256': sha256})
+
+# Временный файл атомарно переносится на место по хэшу, а если такое содержимое уже есть —
+# удаляется; True, если файл появился в хранилище сейчас. Блокировка по хэшу уже взята.
+def place_attachment(sha256, tmp_path):
+    path = attachment_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return True
+
+def remove_unreferenced_attachment(sha256):
+    try:
+        lock_attachment_content(sha256)
+        path = attachment_path(sha256)
+        if not Attachment.query.filter_by(sha256=sha256).first() and os.path.exists(path):
+            os.remove(path)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+
+# Вложения записи истории
+@api.route('/api/History/<int:id>/Attachments')
+class HistoryAttachments(Resource):
+    @responses.marshal_with(api, attachment_model, as_list=True)
+    def get(self, id):
+        """List attachments of a history record"""
+        attachments = Attachment.query.filter_by(history_id=id).order_by(Attachment.id).all()
+        return [attachment_to_dict(attachment) for attachment in attachments], 200
+
+    @api.expect(attachment_upload_parser)
+    @api.response(201, 'Attachment stored')
+    @api.response(404, 'No history found')
+    @api.response(413, 'Attachment is too large')
+    def post(self, id):
+        """Upload an attachment as the raw request body (streamed, deduplicated by content)"""
+        args = attachment_upload_parser.parse_args()
+        if not get_history(id):
+            return {'message': 'No history found'}, 404
+        try:
+            sha256, size, tmp_path = receive_attachment(request.stream)
+        except AttachmentTooLarge:
+            return {'message': 'Attachment is too large'}, 413
+
+        placed = False
+        try:
+            lock_attachment_content(sha256)
+            placed = place_attachment(sha256, tmp_path)
+            attachment = Attachment(
+                history_id=id,
+                sha256=sha256,
+                size=size,
+                filename=os.path.basename(args['filename'])[:255],
+                content_type=(request.mimetype or 'application/octet-stream')[:100]
+            )
+            db.session.add(attachment)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            # Запись не сохранилась — перенесённое содержимое без ссылок не оставляем
+            if placed:
+                remove_unreferenced_attachment(sha256)
+            raise
+        return attachment_to_dict(attachment), 201
+
+# Скачивание и удаление вложения
+@api.route('/api/History/<int:id>/Attachments/<int:attachment_id>')
+class HistoryAttachment(Resource):
+    @api.response(200, 'Attachment content')
+    @api.response(206, 'Requested range of the attachment')
+    @api.response(404, 'Attachment not found')
+    def get(self, id, attachment_id):
+        """Download an attachment; supports Range requests"""
+        attachment = Attachment.query.filter_by(id=attachment_id, history_id=id).first()
+        if not attachment:
+            return {'message': 'Attachment not found'}, 404
+        # send_file сам обрабатывает Range и условные запросы. Файл целиком сервер отдаёт
+        # через wsgi.file_wrapper (sendfile), диапазон werkzeug читает с нужного места
+        # и отдаёт по частям, не загружая в память
+        return send_file(
+            attachment_path(attachment.sha256),
+            mimetype=attachment.content_type,
+            download_name=attachment.filename,
+            conditional=True,
+            etag=attachment.sha256
+        )
+
+    @api.response(200, 'Attachment deleted')
+    @api.response(404, 'Attachment not found')
+    def delete(self, id, attachment_id):
+        """Delete an attachment; the content is removed when no record references it"""
+        attachment = Attachment.query.filter_by(id=attachment_id, history_id=id).first()
+        if not attachment:
+            return {'message': 'Attachment not found'}, 404
+        sha256 = attachment.sha256
+        db.session.delete(attachment)
+        db.session.commit()
+        remove_unreferenced_attachment(sha256)
+        return {'message': 'Attachment deleted'}, 200
+
+# Записи тела массовой загрузки читаются по строкам из потока запроса без буферизации всего тела.
+# NDJSON отдаётся как строки байт (разбираются при проверке), CSV — как словари по заголовку.
+def iter_bulk_records(stream, bulk_format):
+    if bulk_format == 'csv':
+        lines = (line.decode('utf-8', errors='replace') for line in stream)
+        yield from csv.DictReader(lines)
+    else:
+        for line in stream:
+            if line.strip():
+                yield line
+
+def _bulk_int(record, name):
+    try:
+        value = int(str(record[name]))
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if not BULK_INT_MIN <= value <= BULK_INT_MAX:
+        raise ValueError(f'{name} is out of range')
+    return value
+
+# Проверка одной записи; возвращает строку для COPY или бросает ValueError с описанием ошибки
+def parse_bulk_record(record):
+    if isinstance(record, bytes):
+        record = json.loads(record)
+        if not isinstance(record, dict):
+            raise ValueError('Record must be a JSON object')
+    missing = [name for name in BULK_FIELDS if record.get(name) in (None, '')]
+    if missing:
+        raise ValueError(f'Missing fields: {", ".join(missing)}')
+
+    try:
+        date = datetime.fromisoformat(str(record['date']))
+    except ValueError:
+        raise ValueError('date must be in ISO format')
+    # Колонка без часового пояса: смещение переводится в UTC, иначе COPY его отбросит
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    room = str(record['room'])
+    data = str(record['data'])
+    if len(room) > 50:
+        raise ValueError('room is longer than 50 characters')
+    if len(data) > 500:
+        raise ValueError('data is longer than 500 characters')
+    if '\x00' in room or '\x00' in data:
+        raise ValueError('room and data must not contain NUL characters')
+    return (
+        date.isoformat(),
+        _bulk_int(record, 'pacientId'),
+        _bulk_int(record, 'hospitalId'),
+        _bulk_int(record, 'doctorId'),
+        room,
+        data
+    )
+
+def csv_buffer(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+# Загрузка пачки строк через COPY в одной транзакции
+def copy_history_rows(connection, rows, copy_sql=HISTORY_COPY_SQL):
+    cursor = connection.cursor()
+    try:
+        cursor.copy_expert(copy_sql, csv_buffer(rows))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# Загрузка части пачки на шард: COPY во временную таблицу и перенос в history записей,
+# которых загрузка upload_id на шарде ещё не сохраняла, в одной транзакции.
+# Возвращает число вставленных строк.
+def copy_shard_history_rows(connection, upload_id, rows):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(HISTORY_BULK_STAGING_SQL)
+        cursor.copy_expert(HISTORY_BULK_STAGING_COPY_SQL, csv_buffer(rows))
+        cursor.execute(HISTORY_BULK_CLAIM_SQL, (upload_id,))
+        inserted = cursor.rowcount
+        connection.commit()
+        return inserted
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# Запись пачки из пар (номер записи, строка): в основную базу одним COPY или, при
+# шардировании, одной транзакцией на шард с id из общей последовательности. Если шард
+# упал, части пачки на других шардах уже сохранены: они входят в inserted, а при
+# повторе с тем же uploadId пропускаются.
+def flush_history_batch(connections, batch, result):
+    if not history_shards:
+        if None not in connections:
+            connections[None] = db.engine.raw_connection()
+        copy_history_rows(connections[None], [row for number, row in batch])
+        result['inserted'] += len(batch)
+        return
+
+    rows_by_shard = {}
+    for id, (number, row) in zip(next_history_ids(len(batch)), batch):
+        rows_by_shard.setdefault(pacient_shard(row[1]).name, []).append((number, id) + row)
+    for name, rows in rows_by_shard.items():
+        if name not in connections:
+            connections[name] = history_shards[name].engine.raw_connection()
+        result['inserted'] += copy_shard_history_rows(connections[name], result['uploadId'], rows)
+
+# Прерванная массовая загрузка; result содержит committedOffset для продолжения
+class IngestInterrupted(Exception):
+    def __init__(self, status, message, result):
+        super().__init__(message)
+        self.status = status
+        self.result = dict(result, message=message)
+
+# Массовая загрузка записей. Номер записи (offset) считается с 1; committedOffset — номер
+# последней записи, до которой включительно всё сохранено; загрузка продолжается
+# с ?offset=committedOffset&uploadId=<uploadId>
+def ingest_history(records, offset, upload_id):
+    result = {'uploadId': upload_id, 'inserted': 0, 'committedOffset': offset, 'errorCount': 0, 'errors': []}
+    batch = []
+    number = 0
+    connections = {}
+    try:
+        for number, record in enumerate(records, start=1):
+            if number <= offset:
+                continue
+            try:
+                batch.append((number, parse_bulk_record(record)))
+            except ValueError as e:
+                result['errorCount'] += 1
+                if len(result['errors']) < BULK_MAX_ERRORS:
+                    result['errors'].append({'record': number, 'error': str(e)})
+            if len(batch) >= BULK_BATCH_SIZE:
+                flush_history_batch(connections, batch, result)
+                result['committedOffset'] = number
+                batch = []
+        if batch:
+            flush_history_batch(connections, batch, result)
+        result['committedOffset'] = max(number, offset)
+    except csv.Error as e:
+        raise IngestInterrupted(400, f'Malformed CSV: {e}', result)
+    except db.engine.dialect.dbapi.Error as e:
+        raise IngestInterrupted(500, f'Upload interrupted: {e}', result)
+    finally:
+        for connection in connections.values():
+            connection.close()
+    return result
+
+# Массовая загрузка истории посещений
+@api.route('/api/History/Bulk')
+class BulkHistory(Resource):
+    @api.expect(history_bulk_parser)
+    @api.response(200, 'Upload processed; invalid records are listed in errors')
+    @api.response(400, 'Malformed CSV or invalid uploadId; resume from committedOffset with the same uploadId')
+    @api.response(500, 'Upload interrupted; resume from committedOffset with the same uploadId')
+    def post(self):
+        """Load history records from an NDJSON or CSV request body using COPY"""
+        args = history_bulk_parser.parse_args()
+        bulk_format = args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        offset = max(args.get('offset') or 0, 0)
+        upload_id = args.get('uploadId') or uuid.uuid4().hex
+        if len(upload_id) > 64:
+            return {'message': 'uploadId is longer than 64 characters'}, 400
+
+        try:
+            result = ingest_history(iter_bulk_records(request.stream, bulk_format), offset, upload_id)
+        except IngestInterrupted as e:
+            return e.result, e.status
+        return result, 200
+
+def history_values(data):
+    return {
+        'date': datetime.fromisoformat(data['date']),
+        'pacient_id': data['pacientId'],
+        'hospital_id': data['hospitalId'],
+        'doctor_id': data['doctorId'],
+        'room': data['room'],
+        'data': data['data']
+    }
+
+# Обновление записи на шарде. Запись блокируется на время изменения; если её успели
+# перенести между поиском и блокировкой, поиск повторяется. Смена пациента может
+# перенести запись на другой шард.
+def update_sharded_history(id, values):
+    for attempt in range(2):
+        shard = locate_history(id)
+        if not shard:
+            return False
+        target = pacient_shard(values['pacient_id'])
+        with Session(shard.engine) as session:
+            history = session.get(History, id, with_for_update=True)
+            if not history:
+                continue
+            if target is shard:
+                for key, value in values.items():
+                    setattr(history, key, value)
+                session.commit()
+                return True
+            with Session(target.engine) as target_session:
+                target_session.add(History(id=id, **values))
+                target_session.commit()
+            session.delete(history)
+            session.commit()
+            return True
+    return False
 
 # Создание новой записи в истории
 @api.route('/api/History')
 class CreateHistory(Resource):
     @api.expect(history_model)
+    @api.doc(params={'Idempotency-Key': {'in': 'header', 'type': 'string', 'description': 'Retries with the same key get the stored response'}})
     @api.response(201, 'History record created')
+    @api.response(409, 'Request with this Idempotency-Key is still in progress')
+    @api.response(422, 'Idempotency-Key was used with a different request')
+    @idempotency.idempotent
     def post(self):
         """Create a new history record"""
-        data = request.get_json()
-        new_history = History(
-            date=datetime.fromisoformat(data['date']),
-            pacient_id=data['pacientId'],
-            hospital_id=data['hospitalId'],
-            doctor_id=data['doctorId'],
-            room=data['room'],
-            data=data['data']
-        )
-        db.session.add(new_history)
+        values = history_values(request.get_json())
+        if history_shards:
+            with Session(pacient_shard(values['pacient_id']).engine) as session:
+                session.add(History(id=next_history_ids(1)[0], **values))
+                session.commit()
+            return {'message': 'History record created'}, 201
+
+        db.session.add(History(**values))
         db.session.commit()
         return {'message': 'History record created'}, 201
 
@@ -100,21 +1217,383 @@ class UpdateHistory(Resource):
     @api.response(404, 'No history found')
     def put(self, id):
         """Update an existing history record by history ID"""
+        if history_shards:
+            values = history_values(request.get_json())
+            if not update_sharded_history(id, values):
+                return {'message': 'No history found'}, 404
+            return {'message': 'History record updated'}, 200
+
         history = History.query.get(id)
         if not history:
             return {'message': 'No history found'}, 404
 
-        data = request.get_json()
-        history.date = datetime.fromisoformat(data['date'])
-        history.pacient_id = data['pacientId']
-        history.hospital_id = data['hospitalId']
-        history.doctor_id = data['doctorId']
-        history.room = data['room']
-        history.data = data['data']
-        
+        for key, value in history_values(request.get_json()).items():
+            setattr(history, key, value)
         db.session.commit()
         return {'message': 'History record updated'}, 200
 
-if __name__ == '__main__':
+# Секционирование истории. Таблица history секционируется по RANGE (date) помесячно,
+# секции называются history_pYYYYMM; даты вне созданных секций попадают в history_default.
+# Первичный ключ секционированной таблицы — (id, date), id по-прежнему уникален за счёт общей
+# последовательности, поэтому модель History продолжает адресовать записи по id.
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f'history_p{month:%Y%m}'
+
+def history_is_partitioned(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = 'history' AND c.relnamespace = 'public'::regnamespace"
+    )).first() is not None
+
+def list_history_partitions(conn):
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'history' ORDER BY c.relname"
+    )).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return partitions
+
+def create_month_partition(conn, month):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF history "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    ))
+
+# Однократный перевод существующей таблицы в секционированную. Данные копируются в одной
+# транзакции под эксклюзивной блокировкой, поэтому большие таблицы лучше переводить
+# в окно обслуживания командой flask history-partition.
+def partition_history_table(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        if history_is_partitioned(conn):
+            return False
+        conn.execute(text('LOCK TABLE history IN ACCESS EXCLUSIVE MODE'))
+        first, last = conn.execute(text('SELECT min(date), max(date) FROM history')).first()
+
+        conn.execute(text('ALTER TABLE history RENAME TO history_unpartitioned'))
+        conn.execute(text('ALTER TABLE history_unpartitioned DROP CONSTRAINT IF EXISTS history_pkey'))
+        for index in History.__table__.indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+        conn.execute(text(
+            'CREATE TABLE history (LIKE history_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED) '
+            'PARTITION BY RANGE (date)'
+        ))
+        conn.execute(text('ALTER TABLE history ADD PRIMARY KEY (id, date)'))
+        conn.execute(text('ALTER SEQUENCE history_id_seq OWNED BY history.id'))
+        conn.execute(text('CREATE TABLE history_default PARTITION OF history DEFAULT'))
+
+        month = month_start(first or datetime.utcnow())
+        last_month = add_months(month_start(max(last or datetime.utcnow(), datetime.utcnow())), PARTITION_MONTHS_AHEAD)
+        while month <= last_month:
+            create_month_partition(conn, month)
+            month = add_months(month, 1)
+
+        conn.execute(text(
+            'INSERT INTO history (id, date, pacient_id, hospital_id, doctor_id, room, data) '
+            'SELECT id, date, pacient_id, hospital_id, doctor_id, room, data FROM history_unpartitioned'
+        ))
+        conn.execute(text('DROP TABLE history_unpartitioned'))
+        for index in History.__table__.indexes:
+            index.create(bind=conn)
+    return True
+
+# Создание секций от текущего месяца на PARTITION_MONTHS_AHEAD вперёд.
+# Каждая секция создаётся в своей транзакции: ошибка одной (например, если в history_default
+# уже есть строки этого месяца) не мешает остальным.
+def ensure_history_partitions(engine=None):
+    engine = engine or db.engine
+    created = []
+    current = month_start(datetime.utcnow())
+    with engine.connect() as conn:
+        existing = {name for name, month in list_history_partitions(conn)}
+    for offset in range(PARTITION_MONTHS_AHEAD + 1):
+        month = add_months(current, offset)
+        if partition_name(month) in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                create_month_partition(conn, month)
+            created.append(partition_name(month))
+        except Exception:
+            app.logger.exception('Could not create history partition %s', partition_name(month))
+    return created
+
+# Каждый пакет строк сжимается отдельным gzip-блоком (файл остаётся обычным gzip), а смещение
+# блока записывается в history_archive_entry: поиск записи распаковывает только её блок
+def export_partition(conn, name, path):
+    columns = [History.__table__.c[column] for column in ('id', 'date', 'pacient_id', 'hospital_id', 'doctor_id', 'room', 'data')]
+    rows = conn.execution_options(stream_results=True).execute(text(
+        f'SELECT id, date, pacient_id, hospital_id, doctor_id, room, data FROM {name} ORDER BY id'
+    ).columns(*columns))
+    stats = {'rows': 0, 'min_id': None, 'max_id': None}
+
+    partial_path = path + '.partial'
+    with open(partial_path, 'wb') as f:
+        for batch in rows.partitions(EXPORT_BATCH_SIZE):
+            if stats['min_id'] is None:
+                stats['min_id'] = batch[0].id
+            stats['max_id'] = batch[-1].id
+            stats['rows'] += len(batch)
+            offset = f.tell()
+            lines = ''.join(json.dumps(history_to_dict(row), ensure_ascii=False) + '\n' for row in batch)
+            f.write(gzip.compress(lines.encode('utf-8'), compresslevel=6))
+            conn.execute(HistoryArchiveEntry.__table__.insert(),
+                         [{'id': row.id, 'partition': name, 'file_offset': offset} for row in batch])
+    os.replace(partial_path, path)
+    return stats
+
+# Архивация секций, целиком закончившихся раньше older_than_months месяцев назад.
+# С ARCHIVE_TABLESPACE секция переносится в табличное пространство на дешёвом хранилище
+# и остаётся доступной; иначе выгружается в ARCHIVE_DIR в gzip JSON Lines, отсоединяется
+# и удаляется, а GetHistoryById и History/Batch находят такие записи через history_archive_entry.
+def archive_history_partitions(older_than_months, engine=None):
+    engine = engine or db.engine
+    cutoff = add_months(month_start(datetime.utcnow()), -older_than_months)
+    archived = []
+    with engine.connect() as conn:
+        partitions = [(name, month) for name, month in list_history_partitions(conn) if add_months(month, 1) <= cutoff]
+
+    for name, month in partitions:
+        if ARCHIVE_TABLESPACE:
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {name} SET TABLESPACE {ARCHIVE_TABLESPACE}'))
+            archived.append(name)
+            continue
+
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(ARCHIVE_DIR, name + '.jsonl.gz')
+        with engine.begin() as conn:
+            conn.execute(text(f'LOCK TABLE {name} IN SHARE MODE'))
+            stats = export_partition(conn, name, path)
+            conn.execute(HistoryArchive.__table__.insert().values(
+                partition=name, range_from=month, range_to=add_months(month, 1), path=path, **stats
+            ))
+            conn.execute(text(f'ALTER TABLE history DETACH PARTITION {name}'))
+            conn.execute(text(f'DROP TABLE {name}'))
+        app.logger.info('Archived history partition %s (%s rows) to %s', name, stats['rows'], path)
+        archived.append(name)
+    return archived
+
+def archived_history_id(line):
+    # Строки архива начинаются с '{"id": <id>,'
+    return int(line[7:line.index(b',')])
+
+def archive_locations(session, ids):
+    return session.query(HistoryArchiveEntry.id, HistoryArchiveEntry.file_offset, HistoryArchive.path) \
+        .join(HistoryArchive, HistoryArchive.partition == HistoryArchiveEntry.partition) \
+        .filter(HistoryArchiveEntry.id.in_(ids)).all()
+
+# Поиск записей в архивных файлах: history_archive_entry даёт файл и gzip-блок каждой записи,
+# каждый файл открывается один раз, распаковка идёт с начала блока до последней нужной записи
+# (строки файла упорядочены по id)
+def find_archived_histories(ids):
+    if not ids:
+        return {}
+    if history_shards:
+        results = query_shards(list(history_shards.values()), lambda session: archive_locations(session, ids))
+        locations = [location for shard_locations in results for location in shard_locations]
+    else:
+        locations = archive_locations(db.session, ids)
+    blocks = {}
+    for id, offset, path in locations:
+        blocks.setdefault(path, {}).setdefault(offset, set()).add(id)
+
+    found = {}
+    for path, offsets in blocks.items():
+        if not os.path.exists(path):
+            app.logger.error('History archive file %s is missing', path)
+            continue
+        with open(path, 'rb') as f:
+            for offset, wanted in sorted(offsets.items()):
+                f.seek(offset)
+                last_id = max(wanted)
+                with gzip.GzipFile(fileobj=f, mode='rb') as block:
+                    for line in block:
+                        id = archived_history_id(line)
+                        if id in wanted:
+                            found[id] = json.loads(line)
+                        if id >= last_id:
+                            break
+    return found
+
+def find_archived_history(id):
+    return find_archived_histories([id]).get(id)
+
+# Архивы, выгруженные до появления history_archive_entry, индексируются одним проходом по
+# файлу; такой файл — один gzip-блок, все его записи читаются с начала
+def index_history_archives(engine=None):
+    engine = engine or db.engine
+    entries = HistoryArchiveEntry.__table__
+    with engine.connect() as conn:
+        archives = conn.execute(
+            select(HistoryArchive.partition, HistoryArchive.path)
+            .where(HistoryArchive.rows > 0, ~select(entries.c.id).where(entries.c.partition == HistoryArchive.partition).exists())
+        ).all()
+    for partition, path in archives:
+        if not os.path.exists(path):
+            app.logger.error('History archive file %s is missing', path)
+            continue
+        with engine.begin() as conn, gzip.open(path, 'rb') as f:
+            batch = []
+            for line in f:
+                batch.append({'id': archived_history_id(line), 'partition': partition, 'file_offset': 0})
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    conn.execute(pg_insert(entries).on_conflict_do_nothing(), batch)
+                    batch = []
+            if batch:
+                conn.execute(pg_insert(entries).on_conflict_do_nothing(), batch)
+        app.logger.info('Indexed history archive %s', path)
+
+def purge_bulk_records(engine):
+    expired = datetime.utcnow() - timedelta(hours=BULK_UPLOAD_TTL_HOURS)
+    with engine.begin() as conn:
+        conn.execute(delete(HistoryBulkRecord.__table__).where(HistoryBulkRecord.created_at < expired))
+
+# Базы, где лежит таблица history: шарды или основная база
+def history_engines():
+    if history_shards:
+        return [shard.engine for shard in history_shards.values()]
+    return [db.engine]
+
+def run_partition_maintenance():
+    with app.app_context():
+        for engine in history_engines():
+            try:
+                ensure_history_partitions(engine)
+                index_history_archives(engine)
+                purge_bulk_records(engine)
+                if ARCHIVE_AFTER_MONTHS > 0:
+                    archive_history_partitions(ARCHIVE_AFTER_MONTHS, engine)
+            except Exception:
+                app.logger.exception('History partition maintenance failed for %s', engine.url.database)
+    timer = threading.Timer(PARTITION_MAINTENANCE_HOURS * 3600, run_partition_maintenance)
+    timer.daemon = True
+    timer.start()
+
+@app.cli.command('history-partition')
+def history_partition_command():
+    """Convert history to a partitioned table and create upcoming partitions."""
+    for engine in history_engines():
+        if partition_history_table(engine):
+            click.echo(f'{engine.url.database}: history converted to a partitioned table')
+        click.echo(f'{engine.url.database}: created partitions: {ensure_history_partitions(engine)}')
+
+@app.cli.command('history-archive')
+@click.option('--older-than-months', type=int, default=lambda: ARCHIVE_AFTER_MONTHS or 24, show_default='24')
+def history_archive_command(older_than_months):
+    """Archive history partitions older than the given number of months."""
+    for engine in history_engines():
+        click.echo(f'{engine.url.database}: archived partitions: {archive_history_partitions(older_than_months, engine)}')
+
+# Перенос истории одного пациента пачками. Строки пачки блокируются на источнике, копируются
+# на целевой шард (повторно скопированные пропускаются) и только после фиксации там удаляются
+# с источника, поэтому прерванный перенос можно просто запустить заново.
+def move_pacient_history(pacient_id, source, target, batch_size=REBALANCE_BATCH_SIZE):
+    columns = [History.__table__.c[column] for column in HISTORY_COLUMNS]
+    moved = 0
+    while True:
+        with source.engine.begin() as source_conn:
+            rows = source_conn.execute(
+                select(*columns).where(History.pacient_id == pacient_id)
+                .order_by(History.id).limit(batch_size).with_for_update()
+            ).mappings().all()
+            if not rows:
+                return moved
+            with target.engine.begin() as target_conn:
+                target_conn.execute(pg_insert(History.__table__).values([dict(row) for row in rows]).on_conflict_do_nothing())
+            source_conn.execute(delete(History.__table__).where(History.id.in_([row['id'] for row in rows])))
+        moved += len(rows)
+
+# Перебалансировка после изменения HISTORY_SHARDS: пациенты, чей владелец по текущему кольцу
+# не совпадает с шардом, где лежат их записи, переносятся к владельцу. Сервис продолжает
+# работать: пока задан HISTORY_SHARDS_PREVIOUS, записи пациента читаются с обоих шардов.
+# primary переносит историю из основной базы — для перехода на шардирование.
+def rebalance_history(include_primary=False, dry_run=False):
+    sources = list(history_shards.values())
+    if include_primary:
+        sources.append(HistoryShard('primary', db.engine))
+
+    moved = {}
+    for source in sources:
+        with source.engine.connect() as conn:
+            pacient_ids = conn.execute(select(History.pacient_id).distinct()).scalars().all()
+        for pacient_id in pacient_ids:
+            target = pacient_shard(pacient_id)
+            if target is source:
+                continue
+            key = f'{source.name} -> {target.name}'
+            if dry_run:
+                with source.engine.connect() as conn:
+                    rows = conn.execute(select(func.count()).where(History.pacient_id == pacient_id)).scalar()
+            else:
+                rows = move_pacient_history(pacient_id, source, target)
+            moved[key] = moved.get(key, 0) + rows
+            app.logger.info('Moved history of pacient %s: %s (%s rows)', pacient_id, key, rows)
+    return moved
+
+@app.cli.command('history-rebalance')
+@click.option('--include-primary', is_flag=True, help='Also move history stored in the main database.')
+@click.option('--dry-run', is_flag=True, help='Only count the rows that would move.')
+def history_rebalance_command(include_primary, dry_run):
+    """Move patient history to the shards that own it under HISTORY_SHARDS."""
+    if not history_shards:
+        raise click.UsageError('HISTORY_SHARDS is not set')
+    for key, rows in rebalance_history(include_primary, dry_run).items():
+        click.echo(f'{key}: {rows} rows')
+
+# Создание схемы. create_all не меняет уже существующие таблицы,
+# поэтому недостающие колонки и индексы добавляются отдельно
+def prepare_history_schema(engine):
+    db.Model.metadata.create_all(bind=engine, tables=[History.__table__, HistoryArchive.__table__, HistoryArchiveEntry.__table__, HistoryBulkRecord.__table__])
+    with engine.begin() as conn:
+        conn.execute(text(
+            f'ALTER TABLE history ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            f'GENERATED ALWAYS AS ({HISTORY_SEARCH_VECTOR_SQL}) STORED'
+        ))
+    for index in History.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    if HISTORY_PARTITIONING:
+        partition_history_table(engine)
+
+# Общая последовательность id шардированной истории продолжается после наибольшего
+# уже выданного id, в том числе в основной базе при переходе на шардирование
+def prepare_history_id_sequence():
+    max_ids = [0]
+    for engine in [db.engine] + history_engines():
+        with engine.connect() as conn:
+            max_ids.append(conn.execute(select(func.max(History.id))).scalar() or 0)
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE SEQUENCE IF NOT EXISTS history_global_id_seq'))
+        conn.execute(
+            text("SELECT setval('history_global_id_seq', greatest(:max_id, (SELECT last_value FROM history_global_id_seq)))"),
+            {'max_id': max(max_ids) or 1}
+        )
+
+def prepare_database():
     db.create_all()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    for engine in history_engines():
+        prepare_history_schema(engine)
+    if history_shards:
+        prepare_history_id_sequence()
+
+serving.on_startup(prepare_database)
+# Обслуживание партиций — один таймер на экземпляр сервиса (в gunicorn — в мастере)
+if HISTORY_PARTITIONING:
+    serving.on_startup(run_partition_maintenance)
+serving.on_worker_start(jobs.start)
+serving.on_worker_exit(jobs.stop)
+
+if __name__ == '__main__':
+    serving.run_dev_server(app)
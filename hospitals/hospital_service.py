@@ -1,7 +1,10 @@
 from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from flask_restx import Api, Resource, fields, Namespace
 from functools import wraps
+from shared import admission, metrics, profiling, responses, serving, tracing
+from shared.database import engine_options
+from shared.replicas import RoutingSQLAlchemy
+from sqlalchemy.orm import selectinload
 import jwt
 import datetime
 import os
@@ -19,7 +22,10 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{db_user}:{db_password}@{
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Отключение предупреждения
 app.config['SECRET_KEY'] = 'your_secret_key'
 
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+db = RoutingSQLAlchemy(app)
+serving.register_health(app, db)
+metrics.register_metrics(app, db)
 
 # Инициализация Flask-RESTx Api
 authorizations = {
@@ -39,6 +45,10 @@ api = Api(
     authorizations=authorizations,
     security='Bearer Auth'
 )
+responses.register_responses(app, api)
+profiling.register_profiling(app, api)
+tracing.register_tracing(app, 'hospitals')
+admission.register_admission(app)
 
 # Создание Namespace для больниц
 ns = Namespace('Hospitals', description='Операции с больницами и кабинетами', path='/api/Hospitals')
@@ -152,7 +162,7 @@ class HospitalList(Resource):
     @ns.doc('get_hospitals')
     @ns.expect(api.parser().add_argument('from', type=int, location='args', default=0, help='Смещение'))
     @ns.expect(api.parser().add_argument('count', type=int, location='args', default=10, help='Количество записей'))
-    @ns.marshal_list_with(hospital_model)
+    @responses.marshal_with(ns, hospital_model, as_list=True)
     @ns.response(403, 'Token is missing', model=error_model)
     @ns.response(401, 'Token expired', model=error_model)
     @ns.response(403, 'Token is invalid', model=error_model)
@@ -166,7 +176,8 @@ class HospitalList(Resource):
         from_ = args.get('from', 0)
         count = args.get('count', 10)
 
-        hospitals = Hospital.query.filter_by(is_deleted=False).offset(from_).limit(count).all()
+        # Кабинеты всех больниц страницы — одним запросом, а не отдельным на каждую больницу
+        hospitals = Hospital.query.options(selectinload(Hospital.rooms)).filter_by(is_deleted=False).offset(from_).limit(count).all()
         output = []
         for hospital in hospitals:
             hospital_data = {
@@ -273,7 +284,7 @@ class HospitalResource(Resource):
 @ns.param('id', 'Уникальный идентификатор больницы')
 class HospitalRooms(Resource):
     @ns.doc('get_hospital_rooms')
-    @ns.marshal_list_with(room_model)
+    @responses.marshal_with(ns, room_model, as_list=True)
     @ns.response(403, 'Token is missing', model=error_model)
     @ns.response(401, 'Token expired', model=error_model)
     @ns.response(403, 'Token is invalid', model=error_model)
@@ -294,6 +305,9 @@ class HospitalRooms(Resource):
             output.append(room_data)
         return output, 200
 
-if __name__ == '__main__':
+@serving.on_startup
+def prepare_database():
     db.create_all()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+
+if __name__ == '__main__':
+    serving.run_dev_server(app)
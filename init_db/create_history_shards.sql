@@ -0,0 +1,3 @@
+CREATE DATABASE documents_shard_1;
+CREATE DATABASE documents_shard_2;
+CREATE DATABASE documents_shard_3;
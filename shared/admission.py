@@ -0,0 +1,188 @@
+from collections import OrderedDict
+from flask import g, request
+from shared import metrics
+import jwt
+import math
+import os
+import threading
+import time
+
+# Управление допуском запросов в процессе-обработчике. Маршруты сервиса делятся на классы
+# (register_admission(app, classes={('POST', '/api/Authentication/SignIn'): 'expensive'}),
+# остальные — класс default), у класса — предел одновременных запросов и ограниченная очередь:
+#   ADMISSION_LIMITS="expensive=2:4:500,default=64:64"  — класс=одновременно:очередь[:ожидание, мс]
+# Запрос отклоняется сразу с 503 и Retry-After, если очередь полна или ожидаемое по среднему
+# времени обработки ожидание длиннее допустимого, и с 503 — если не дождался начала обработки.
+# Ожидающий запрос занимает поток gunicorn, поэтому сумма пределов и очередей дорогих классов
+# должна быть меньше WEB_THREADS: остальные потоки остаются дешёвым запросам.
+# Ограничение частоты по клиенту (пользователь из токена, иначе адрес) — token bucket, 429:
+#   RATE_LIMITS="expensive=1:5,default=50:100"  — класс=запросов в секунду:запас
+# Пределы действуют в каждом обработчике gunicorn отдельно. Без переменных ничего не ограничено.
+# Маршруты, обслуживаемые вне Flask (ASGI-режим расписаний), проверяются тем же объектом
+# AdmissionControl из app.extensions['admission'].
+ADMISSION_LIMITS = os.environ.get('ADMISSION_LIMITS', '')
+RATE_LIMITS = os.environ.get('RATE_LIMITS', '')
+ADMISSION_MAX_WAIT_MS = float(os.environ.get('ADMISSION_MAX_WAIT_MS', '1000'))
+# Сколько клиентов помнит ограничитель частоты; давно не приходившие забываются первыми
+RATE_LIMIT_CLIENTS = int(os.environ.get('RATE_LIMIT_CLIENTS', '10000'))
+# Проверки оркестратора и сбор метрик не ограничиваются
+EXEMPT_PATHS = ('/health/', '/metrics')
+
+def parse_limits(value):
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, numbers = item.split('=', 1)
+        limits[name.strip()] = [float(number) for number in numbers.split(':')]
+    return limits
+
+class EndpointClass:
+    """Concurrency limit with a bounded queue and a wait deadline for one class of endpoints."""
+
+    def __init__(self, name, concurrency, queue, max_wait_seconds):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.waiting = 0
+        # Скользящее среднее времени обработки для оценки ожидания в очереди
+        self.average_seconds = 0.0
+        self.condition = threading.Condition()
+
+    def expected_wait(self, position):
+        return position * self.average_seconds / self.concurrency
+
+    def try_acquire(self):
+        """Admit without waiting; False when the request would have to queue."""
+        with self.condition:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self):
+        """None when admitted, otherwise the suggested Retry-After in seconds."""
+        with self.condition:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                return None
+            expected = self.expected_wait(self.waiting + 1)
+            if self.waiting >= self.queue or expected > self.max_wait_seconds:
+                return max(expected, self.max_wait_seconds)
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait_seconds
+            try:
+                while self.active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return max(self.expected_wait(self.waiting), self.max_wait_seconds)
+                    self.condition.wait(remaining)
+                self.active += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self, seconds):
+        with self.condition:
+            self.active -= 1
+            self.average_seconds = seconds if not self.average_seconds else 0.8 * self.average_seconds + 0.2 * seconds
+            self.condition.notify()
+
+class TokenBuckets:
+    """Per-client token buckets: rate tokens per second, at most burst tokens."""
+
+    def __init__(self, rate, burst, max_clients=RATE_LIMIT_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, client):
+        """0 when the request may proceed, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self.buckets[client] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+            return wait
+
+# Ответ об отклонении: (тело, статус, заголовки) — его возвращают и Flask, и ASGI-обработчики
+def rejection_parts(status, message, retry_after, endpoint_class, reason):
+    metrics.REQUESTS_REJECTED.labels(endpoint_class, reason).inc()
+    return {'message': message}, status, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+class AdmissionControl:
+    """Concurrency limits and per-client rate limits of one worker process."""
+
+    def __init__(self, app, classes=None):
+        self.app = app
+        self.classes = classes or {}
+        self.limits = {name: EndpointClass(name, int(numbers[0]), int(numbers[1]) if len(numbers) > 1 else 0,
+                                           (numbers[2] if len(numbers) > 2 else ADMISSION_MAX_WAIT_MS) / 1000)
+                       for name, numbers in parse_limits(ADMISSION_LIMITS).items()}
+        self.rates = {name: TokenBuckets(numbers[0], numbers[1] if len(numbers) > 1 else numbers[0])
+                      for name, numbers in parse_limits(RATE_LIMITS).items()}
+
+    def endpoint_class(self, method, rule):
+        return self.classes.get((method, rule), 'default')
+
+    def client_key(self, auth_header, remote_addr):
+        if auth_header and auth_header.startswith('Bearer '):
+            try:
+                return f"user:{jwt.decode(auth_header[7:], self.app.config['SECRET_KEY'], algorithms=['HS256'])['user_id']}"
+            except (jwt.InvalidTokenError, KeyError):
+                pass
+        return f'addr:{remote_addr}'
+
+    def rate_limited(self, endpoint_class, auth_header, remote_addr):
+        """Rejection parts when the client is over its rate, otherwise None."""
+        buckets = self.rates.get(endpoint_class)
+        if buckets is None:
+            return None
+        wait = buckets.take(self.client_key(auth_header, remote_addr))
+        if wait:
+            return rejection_parts(429, 'Too many requests', wait, endpoint_class, 'rate_limit')
+        return None
+
+    def overloaded(self, endpoint_class, retry_after):
+        return rejection_parts(503, 'Service is overloaded, retry later', retry_after, endpoint_class, 'overload')
+
+def register_admission(app, classes=None):
+    control = AdmissionControl(app, classes)
+    if not control.limits and not control.rates:
+        return
+    app.extensions['admission'] = control
+
+    @app.before_request
+    def admit_request():
+        if request.path.startswith(EXEMPT_PATHS):
+            return None
+        rule = request.url_rule.rule if request.url_rule else None
+        endpoint_class = control.endpoint_class(request.method, rule)
+
+        rejected = control.rate_limited(endpoint_class, request.headers.get('Authorization'), request.remote_addr)
+        if rejected is not None:
+            return rejected
+
+        limit = control.limits.get(endpoint_class)
+        if limit is not None:
+            retry_after = limit.acquire()
+            if retry_after is not None:
+                return control.overloaded(endpoint_class, retry_after)
+            g.admission = (limit, time.perf_counter())
+        return None
+
+    @app.teardown_request
+    def release_request(exc):
+        admitted = g.pop('admission', None)
+        if admitted is not None:
+            limit, started = admitted
+            limit.release(time.perf_counter() - started)
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+import os
+
+# Пул соединений с базой. Настраивается окружением каждого сервиса; предел соединений
+# одного процесса — DB_POOL_SIZE + DB_MAX_OVERFLOW, его нужно умножать на число
+# обработчиков gunicorn и экземпляров сервиса и сверять с max_connections.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+# Соединения старше DB_POOL_RECYCLE секунд пересоздаются, а pre-ping отбрасывает
+# соединения, оборванные, например, при переключении на реплику
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# Работа через PgBouncer в режиме pool_mode=transaction: серверное соединение закрепляется
+# только на время транзакции, поэтому нельзя полагаться на состояние сессии — подготовленные
+# запросы и сессионные advisory-блокировки
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')
+
+def engine_options(url=None):
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    # psycopg2 подготовленных запросов не создаёт, asyncpg — кэширует их на соединении
+    if DB_PGBOUNCER and url is not None and make_url(url).get_driver_name() == 'asyncpg':
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    return options
+
+def pool_status(engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'class': type(pool).__name__}
+    return {
+        'class': type(pool).__name__,
+        'size': pool.size(),
+        'max_overflow': DB_MAX_OVERFLOW,
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+    }
+
+# Соединение для advisory-блокировки на время запроса. Напрямую к Postgres блокировка
+# сессионная, на соединении в autocommit; за PgBouncer она берётся в транзакции и снимается
+# при её завершении вместе с записанными в этой транзакции данными.
+@contextmanager
+def lock_connection(engine):
+    if DB_PGBOUNCER:
+        with engine.begin() as conn:
+            yield conn
+    else:
+        with engine.execution_options(isolation_level='AUTOCOMMIT').connect() as conn:
+            yield conn
+
+def try_advisory_lock(conn, scope):
+    function = 'pg_try_advisory_xact_lock' if DB_PGBOUNCER else 'pg_try_advisory_lock'
+    return conn.execute(text(f'SELECT {function}(hashtextextended(:scope, 0))'), {'scope': scope}).scalar()
+
+def advisory_unlock(conn, scope):
+    if not DB_PGBOUNCER:
+        conn.execute(text('SELECT pg_advisory_unlock(hashtextextended(:scope, 0))'), {'scope': scope})
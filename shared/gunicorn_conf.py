@@ -0,0 +1,45 @@
+import multiprocessing
+import os
+import tempfile
+
+# Рабочий режим сервисов: gunicorn с предварительной загрузкой приложения в мастере.
+#   gunicorn -c shared/gunicorn_conf.py <service>:app
+# WEB_WORKERS — процессов-обработчиков, WEB_THREADS — потоков в каждом (больше одного —
+# gthread), WEB_WORKER_CLASS — другой класс обработчика, например uvicorn.workers.UvicornWorker
+# для ASGI-приложений, WEB_TIMEOUT — предел обработки запроса, WEB_GRACEFUL_TIMEOUT — сколько
+# секунд обработчик при остановке дорабатывает начатые запросы.
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get('WEB_THREADS', '1'))
+worker_class = os.environ.get('WEB_WORKER_CLASS') or ('gthread' if threads > 1 else 'sync')
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('WEB_ACCESS_LOG') or None
+
+# Метрики обработчиков складываются в общем каталоге; переменная должна быть задана до
+# импорта prometheus_client, то есть до загрузки приложения. Заданный явно каталог
+# при запуске должен быть пустым.
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus-')
+
+# Хуки вызываются после загрузки приложения, когда каталог сервиса уже в sys.path
+
+def when_ready(server):
+    from shared import serving
+    serving.run_hooks('startup')
+
+def post_fork(server, worker):
+    from shared import serving
+    serving.run_hooks('worker_start')
+
+def worker_exit(server, worker):
+    from shared import serving
+    serving.run_hooks('worker_exit')
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,112 @@
+from flask import current_app, request
+from flask_restx.utils import unpack
+from functools import wraps
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from shared.database import advisory_unlock, lock_connection, try_advisory_lock
+import datetime
+import hashlib
+import json
+import jwt
+import logging
+import os
+import random
+import sqlalchemy as sa
+import time
+
+# Ключи идемпотентности: сколько часов хранится ответ и сколько секунд повтор ждёт
+# завершения первого запроса с тем же ключом
+IDEMPOTENCY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '30'))
+IDEMPOTENCY_PURGE_RATE = 0.01
+
+logger = logging.getLogger('idempotency')
+
+# Сохранённые ответы запросов с заголовком Idempotency-Key в таблице idempotency_key базы
+# сервиса. error(status, message) — ответ сервиса об ошибке: возвращается декоратором или
+# прерывает запрос (api.abort).
+class IdempotencyStore:
+    def __init__(self, db, error):
+        self.db = db
+        self.error = error
+        self.table = sa.Table(
+            'idempotency_key', db.metadata,
+            sa.Column('key', sa.String(64), primary_key=True),
+            sa.Column('request_hash', sa.String(64), nullable=False),
+            sa.Column('status_code', sa.Integer, nullable=False),
+            sa.Column('response', sa.Text, nullable=False),
+            sa.Column('expires_at', sa.DateTime, nullable=False, index=True),
+        )
+
+    # Advisory-блокировка по ключу (см. shared.database.lock_connection): повторы с тем же ключом
+    # (в том числе в других процессах) ждут, пока первый запрос не завершится и не сохранит ответ
+    def acquire_lock(self, conn, scope):
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while not try_advisory_lock(conn, scope):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def release_lock(self, conn, scope):
+        advisory_unlock(conn, scope)
+
+    def store_response(self, conn, scope, request_hash, status_code, data):
+        values = {
+            'key': scope,
+            'request_hash': request_hash,
+            'status_code': status_code,
+            'response': json.dumps(data, default=str),
+            'expires_at': datetime.datetime.utcnow() + datetime.timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        }
+        conn.execute(pg_insert(self.table).values(**values).on_conflict_do_update(index_elements=['key'], set_=values))
+        if random.random() < IDEMPOTENCY_PURGE_RATE:
+            conn.execute(self.table.delete().where(self.table.c.expires_at < datetime.datetime.utcnow()))
+
+    # Ключ принадлежит вызывающему: пользователю из токена, а без него — заголовку Authorization,
+    # чтобы другой клиент с тем же ключом не получил чужой сохранённый ответ
+    def caller(self):
+        auth_header = request.headers.get('Authorization', '')
+        try:
+            return f"user:{jwt.decode(auth_header.split(' ')[-1], current_app.config['SECRET_KEY'], algorithms=['HS256'])['user_id']}"
+        except (jwt.InvalidTokenError, KeyError):
+            return f'authorization:{auth_header}'
+
+    # Декоратор идемпотентности по заголовку Idempotency-Key. Успешный ответ сохраняется на
+    # IDEMPOTENCY_TTL_HOURS, повтор с тем же ключом получает его без повторного выполнения.
+    # Ошибки не сохраняются: запрос с ошибкой ничего не записал, и его можно выполнить снова.
+    def idempotent(self, f):
+        table = self.table
+
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return f(*args, **kwargs)
+            if len(key) > 255:
+                return self.error(400, 'Idempotency-Key is too long')
+
+            scope = hashlib.sha256(f'{self.caller()} {request.method} {request.path} {key}'.encode()).hexdigest()
+            request_hash = hashlib.sha256(request.get_data()).hexdigest()
+            with lock_connection(self.db.engine) as conn:
+                if not self.acquire_lock(conn, scope):
+                    return self.error(409, 'A request with this Idempotency-Key is still in progress')
+                try:
+                    stored = conn.execute(
+                        sa.select(table.c.request_hash, table.c.status_code, table.c.response)
+                        .where(table.c.key == scope, table.c.expires_at > datetime.datetime.utcnow())
+                    ).first()
+                    if stored:
+                        if stored.request_hash != request_hash:
+                            return self.error(422, 'Idempotency-Key was used with a different request')
+                        logger.debug("Replaying stored response for idempotency key %s", key)
+                        return json.loads(stored.response), stored.status_code, {'Idempotent-Replayed': 'true'}
+
+                    result = f(*args, **kwargs)
+                    data, status_code, headers = unpack(result)
+                    if 200 <= status_code < 300:
+                        self.store_response(conn, scope, request_hash, status_code, data)
+                    return result
+                finally:
+                    self.release_lock(conn, scope)
+
+        return decorated
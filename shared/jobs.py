@@ -0,0 +1,260 @@
+from flask_restx import Resource, fields
+from sqlalchemy import text
+import sqlalchemy as sa
+import json
+import logging
+import os
+import threading
+import uuid
+
+# Фоновые задачи сервисов. Очередь — таблица background_job в базе сервиса; обработчики
+# забирают задачи через FOR UPDATE SKIP LOCKED, поэтому несколько процессов делят очередь
+# без блокировок друг друга. Настройки: JOB_WORKERS — потоков-обработчиков в процессе,
+# JOB_POLL_SECONDS — период опроса очереди, JOB_STALE_SECONDS — через сколько секунд без
+# отметки о ходе выполнения задача считается брошенной и берётся заново, JOB_MAX_ATTEMPTS —
+# сколько раз, JOB_TTL_HOURS — сколько хранятся завершённые задачи.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '1'))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_TTL_HOURS = float(os.environ.get('JOB_TTL_HOURS', '72'))
+JOB_MAINTENANCE_SECONDS = 60
+JOB_STOP_SECONDS = float(os.environ.get('JOB_STOP_SECONDS', '10'))
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+logger = logging.getLogger('jobs')
+
+DEQUEUE_SQL = text("""
+    UPDATE background_job
+    SET status = 'running', started_at = coalesce(started_at, now()), heartbeat_at = now(), attempts = attempts + 1
+    WHERE id = (
+        SELECT id FROM background_job
+        WHERE kind = ANY(:kinds) AND (
+            status = 'queued'
+            OR (status = 'running' AND heartbeat_at < now() - :stale * interval '1 second' AND attempts < :max_attempts)
+        )
+        ORDER BY created_at
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id, kind, params
+""")
+
+# Брошенные задачи, исчерпавшие попытки, и старые завершённые задачи
+FAIL_ABANDONED_SQL = text("""
+    UPDATE background_job
+    SET status = 'failed', error = 'Worker stopped responding', finished_at = now()
+    WHERE status = 'running' AND heartbeat_at < now() - :stale * interval '1 second' AND attempts >= :max_attempts
+""")
+PURGE_FINISHED_SQL = text("""
+    DELETE FROM background_job
+    WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < now() - :ttl * interval '1 hour'
+""")
+
+class JobCancelled(Exception):
+    pass
+
+# Выполняемая задача; передаётся обработчику для отметок о ходе выполнения
+class Job:
+    def __init__(self, runner, id, kind, params):
+        self.runner = runner
+        self.id = id
+        self.kind = kind
+        self.params = params
+
+    # Отметка о ходе выполнения; заодно продлевает задачу и проверяет запрос на отмену.
+    # Обработчику достаточно вызывать её между пачками работы.
+    def progress(self, done, total=None):
+        table = self.runner.table
+        values = {'progress_done': done, 'heartbeat_at': sa.func.now()}
+        if total is not None:
+            values['progress_total'] = total
+        with self.runner.db.engine.begin() as conn:
+            cancel_requested = conn.execute(
+                table.update().where(table.c.id == self.id).values(**values).returning(table.c.cancel_requested)
+            ).scalar()
+        if cancel_requested:
+            raise JobCancelled()
+
+class JobRunner:
+    def __init__(self, app, db, workers=JOB_WORKERS):
+        self.app = app
+        self.db = db
+        self.workers = workers
+        self.handlers = {}
+        self.table = sa.Table(
+            'background_job', db.metadata,
+            sa.Column('id', sa.String(32), primary_key=True),
+            sa.Column('kind', sa.String(100), nullable=False),
+            sa.Column('params', sa.Text, nullable=False),
+            sa.Column('status', sa.String(20), nullable=False, server_default='queued'),
+            sa.Column('progress_done', sa.BigInteger, nullable=False, server_default='0'),
+            sa.Column('progress_total', sa.BigInteger),
+            sa.Column('result', sa.Text),
+            sa.Column('error', sa.Text),
+            sa.Column('cancel_requested', sa.Boolean, nullable=False, server_default=sa.false()),
+            sa.Column('attempts', sa.Integer, nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
+            sa.Column('started_at', sa.DateTime),
+            sa.Column('heartbeat_at', sa.DateTime),
+            sa.Column('finished_at', sa.DateTime),
+            sa.Index('ix_background_job_status_created', 'status', 'created_at'),
+        )
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    # Регистрация обработчика: fn(job, params) возвращает результат, сериализуемый в JSON
+    def task(self, kind):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def submit(self, kind, params=None):
+        if kind not in self.handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job_id = uuid.uuid4().hex
+        with self.db.engine.begin() as conn:
+            conn.execute(self.table.insert().values(id=job_id, kind=kind, params=json.dumps(params or {})))
+        self._wakeup.set()
+        return self.status(job_id)
+
+    def status(self, job_id):
+        with self.db.engine.connect() as conn:
+            row = conn.execute(self.table.select().where(self.table.c.id == job_id)).first()
+        return job_to_dict(row) if row else None
+
+    # Задача в очереди отменяется сразу, выполняемая — при следующей отметке о ходе выполнения
+    def cancel(self, job_id):
+        table = self.table
+        with self.db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == job_id, table.c.status == 'queued')
+                         .values(status='cancelled', cancel_requested=True, finished_at=sa.func.now()))
+            conn.execute(table.update().where(table.c.id == job_id, table.c.status == 'running')
+                         .values(cancel_requested=True))
+        return self.status(job_id)
+
+    # Запуск обработчиков в текущем процессе
+    def start(self):
+        if self._threads or not self.handlers:
+            return
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(number,), name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # Остановка при завершении процесса: новые задачи не берутся, выполняемую ждём до timeout
+    # секунд; недоделанная задача после JOB_STALE_SECONDS достанется другому процессу
+    def stop(self, timeout=JOB_STOP_SECONDS):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _dequeue(self):
+        with self.db.engine.begin() as conn:
+            return conn.execute(DEQUEUE_SQL, {
+                'kinds': list(self.handlers), 'stale': JOB_STALE_SECONDS, 'max_attempts': JOB_MAX_ATTEMPTS
+            }).first()
+
+    def _finish(self, job_id, **values):
+        with self.db.engine.begin() as conn:
+            conn.execute(self.table.update().where(self.table.c.id == job_id)
+                         .values(finished_at=sa.func.now(), **values))
+
+    def _run(self, row):
+        job = Job(self, row.id, row.kind, json.loads(row.params))
+        logger.info('Job %s (%s) started', job.id, job.kind)
+        try:
+            with self.app.app_context():
+                result = self.handlers[job.kind](job, job.params)
+        except JobCancelled:
+            logger.info('Job %s (%s) cancelled', job.id, job.kind)
+            self._finish(job.id, status='cancelled')
+        except Exception as e:
+            logger.exception('Job %s (%s) failed', job.id, job.kind)
+            self._finish(job.id, status='failed', error=str(e))
+        else:
+            logger.info('Job %s (%s) done', job.id, job.kind)
+            self._finish(job.id, status='done', result=json.dumps(result, default=str))
+
+    def _maintain(self):
+        with self.db.engine.begin() as conn:
+            conn.execute(FAIL_ABANDONED_SQL, {'stale': JOB_STALE_SECONDS, 'max_attempts': JOB_MAX_ATTEMPTS})
+            conn.execute(PURGE_FINISHED_SQL, {'ttl': JOB_TTL_HOURS})
+
+    def _work(self, number):
+        idle_polls = 0
+        while not self._stopping.is_set():
+            try:
+                if number == 0 and idle_polls % max(int(JOB_MAINTENANCE_SECONDS / JOB_POLL_SECONDS), 1) == 0:
+                    self._maintain()
+                row = self._dequeue()
+                if row:
+                    idle_polls = 0
+                    self._run(row)
+                    continue
+            except Exception:
+                logger.exception('Job worker %s failed to poll the queue', number)
+            idle_polls += 1
+            self._wakeup.wait(JOB_POLL_SECONDS)
+            self._wakeup.clear()
+
+    # Эндпоинты состояния и отмены задачи: GET и DELETE /api/Jobs/<job_id>.
+    # decorators — проверки доступа сервиса, например token_required; аргументы, которые
+    # они добавляют (current_user в accounts), обработчикам не нужны.
+    def register_routes(self, api, decorators=()):
+        job_model = api.model('Job', {
+            'jobId': fields.String(description='Job ID'),
+            'kind': fields.String(description='Job type'),
+            'status': fields.String(description='Job status', enum=list(JOB_STATUSES)),
+            'progressDone': fields.Integer(description='Processed items'),
+            'progressTotal': fields.Integer(description='Total items, if known'),
+            'result': fields.Raw(description='Result of a finished job'),
+            'error': fields.String(description='Error of a failed job'),
+            'createdAt': fields.String(description='Queued at'),
+            'startedAt': fields.String(description='Started at'),
+            'finishedAt': fields.String(description='Finished at')
+        })
+        runner = self
+
+        @api.route('/api/Jobs/<string:job_id>')
+        class JobResource(Resource):
+            method_decorators = list(decorators)
+
+            @api.marshal_with(job_model)
+            @api.response(404, 'Job not found')
+            def get(self, job_id, **kwargs):
+                """Get the status and progress of a background job"""
+                job = runner.status(job_id)
+                if not job:
+                    api.abort(404, 'Job not found')
+                return job, 200
+
+            @api.marshal_with(job_model)
+            @api.response(404, 'Job not found')
+            def delete(self, job_id, **kwargs):
+                """Cancel a background job"""
+                job = runner.cancel(job_id)
+                if not job:
+                    api.abort(404, 'Job not found')
+                return job, 200
+
+        return job_model
+
+def job_to_dict(row):
+    return {
+        'jobId': row.id,
+        'kind': row.kind,
+        'status': row.status,
+        'progressDone': row.progress_done,
+        'progressTotal': row.progress_total,
+        'result': json.loads(row.result) if row.result else None,
+        'error': row.error,
+        'createdAt': row.created_at.isoformat() if row.created_at else None,
+        'startedAt': row.started_at.isoformat() if row.started_at else None,
+        'finishedAt': row.finished_at.isoformat() if row.finished_at else None
+    }
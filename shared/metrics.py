@@ -0,0 +1,131 @@
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from shared import profiling, serving
+from shared.database import pool_status
+import logging
+import os
+import threading
+import time
+
+# Метрики сервиса в формате Prometheus: GET /metrics.
+# Под gunicorn значения всех обработчиков складываются через каталог PROMETHEUS_MULTIPROC_DIR
+# (его задаёт shared/gunicorn_conf.py); без него — метрики текущего процесса.
+POOL_REFRESH_SECONDS = 1.0
+
+logger = logging.getLogger('metrics')
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to produce the response, by route and status',
+    ['method', 'route', 'status']
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled', multiprocess_mode='livesum'
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Database statement execution time; _count is the number of statements',
+    ['database']
+)
+DB_QUERY_ERRORS = Counter(
+    'db_query_errors_total', 'Database statements that raised an error', ['database']
+)
+UPSTREAM_DURATION = Histogram(
+    'upstream_request_duration_seconds', 'Calls to other services, by upstream and status',
+    ['upstream', 'status']
+)
+REQUESTS_REJECTED = Counter(
+    'http_requests_rejected_total', 'Requests shed by admission control (overload) or rate limits (rate_limit)',
+    ['endpoint_class', 'reason']
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Lookups in in-process caches by cache and result (hit, miss)', ['cache', 'result']
+)
+CACHE_EVICTIONS = Counter(
+    'cache_evictions_total', 'Entries dropped from in-process caches: lru, expired or stale', ['cache', 'reason']
+)
+CACHE_ENTRIES = Gauge(
+    'cache_entries', 'Entries held by in-process caches', ['cache'], multiprocess_mode='livesum'
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Connection pool occupancy by engine and state',
+    ['engine', 'state'], multiprocess_mode='livesum'
+)
+
+def observe_request(method, route, status, seconds):
+    REQUEST_DURATION.labels(method, route, str(status)).observe(seconds)
+
+def observe_upstream(upstream, status, seconds):
+    UPSTREAM_DURATION.labels(upstream, str(status)).observe(seconds)
+    profiling.record_upstream(seconds)
+
+# Время каждой инструкции: события всех движков процесса, в том числе асинхронных
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def observe_query(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_DURATION.labels(conn.engine.url.database or '').observe(time.perf_counter() - context.metrics_started)
+
+@event.listens_for(Engine, 'handle_error')
+def count_query_error(exception_context):
+    DB_QUERY_ERRORS.labels(exception_context.engine.url.database or '').inc()
+
+def refresh_pool_gauges(engines):
+    for name, engine in engines().items():
+        for state, value in pool_status(engine).items():
+            if state != 'class':
+                DB_POOL_CONNECTIONS.labels(name, state).set(value)
+
+# Занятость пулов снимается фоновым потоком каждого обработчика, а не в запросе:
+# в after_request соединение самого запроса ещё не возвращено в пул
+def start_pool_refresher(engines):
+    def refresh():
+        while True:
+            try:
+                refresh_pool_gauges(engines)
+            except Exception:
+                logger.exception('Could not refresh connection pool metrics')
+            time.sleep(POOL_REFRESH_SECONDS)
+
+    threading.Thread(target=refresh, name='pool-metrics', daemon=True).start()
+
+# Подключение метрик к Flask-приложению. engines — как в serving.register_health.
+def register_metrics(app, db, engines=None):
+    engines = engines or db.service_engines
+    serving.on_worker_start(lambda: start_pool_refresher(engines))
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def observe_response(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            REQUESTS_IN_FLIGHT.dec()
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+        return response
+
+    # Запрос, не дошедший до after_request (ошибка при формировании ответа)
+    @app.teardown_request
+    def finish_request_timer(exc):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            REQUESTS_IN_FLIGHT.dec()
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe_request(request.method, route, 500, time.perf_counter() - started)
+
+    def metrics():
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
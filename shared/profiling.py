@@ -0,0 +1,135 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import time
+
+# Профилирование запросов, включается REQUEST_PROFILING=true: число и время SQL-инструкций,
+# время вызовов других сервисов и сериализации ответа в заголовке Server-Timing, а инструкции
+# дольше SLOW_QUERY_MS — в журнале (не больше SLOW_QUERY_LOG_LIMIT самых долгих на запрос).
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', 'false').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG_LIMIT = int(os.environ.get('SLOW_QUERY_LOG_LIMIT', '5'))
+
+logger = logging.getLogger('profiling')
+
+class RequestProfile:
+    def __init__(self, slow_seconds=SLOW_QUERY_MS / 1000):
+        self.slow_seconds = slow_seconds
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.upstream_seconds = 0.0
+        self.serialize_seconds = 0.0
+        # (секунды, инструкция) для инструкций не быстрее slow_seconds
+        self.statements = []
+
+    def server_timing(self, total_seconds):
+        app_seconds = max(total_seconds - self.db_seconds - self.upstream_seconds - self.serialize_seconds, 0.0)
+        return ', '.join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"',
+            f'upstream;dur={self.upstream_seconds * 1000:.1f}',
+            f'serialize;dur={self.serialize_seconds * 1000:.1f}',
+            f'app;dur={app_seconds * 1000:.1f}',
+            f'total;dur={total_seconds * 1000:.1f}',
+        ])
+
+# Профиль текущего запроса; контекстная переменная, а не g — события движка приходят и из
+# потоков и задач, где контекста приложения нет
+_current = ContextVar('request_profile', default=None)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context.profiling_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, 'profiling_started', None)
+    if profile is None or started is None:
+        return
+    seconds = time.perf_counter() - started
+    profile.queries += 1
+    profile.db_seconds += seconds
+    if seconds >= profile.slow_seconds:
+        profile.statements.append((seconds, statement))
+
+def record_upstream(seconds):
+    profile = _current.get()
+    if profile is not None:
+        profile.upstream_seconds += seconds
+
+# Подсчёт инструкций в блоке — для проверок числа запросов к базе:
+#   with count_queries() as profile:
+#       client.get('/api/Hospitals')
+#   profile.queries, profile.statements
+@contextmanager
+def count_queries():
+    profile = RequestProfile(slow_seconds=0)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+def assert_max_queries(client, max_queries, method, path, **kwargs):
+    """Send a request with the Flask test client and fail if it ran more than max_queries statements.
+
+    The returned response carries the statement counts as response.query_profile.
+    """
+    with count_queries() as profile:
+        response = client.open(path, method=method, **kwargs)
+    if profile.queries > max_queries:
+        statements = '\n'.join(statement for seconds, statement in profile.statements)
+        raise AssertionError(f'{method} {path} ran {profile.queries} queries, expected at most {max_queries}:\n{statements}')
+    response.query_profile = profile
+    return response
+
+def timed_representation(representation):
+    def represent(data, code, headers=None):
+        started = time.perf_counter()
+        try:
+            return representation(data, code, headers)
+        finally:
+            profile = _current.get()
+            if profile is not None:
+                profile.serialize_seconds += time.perf_counter() - started
+    return represent
+
+def log_slow_statements(profile):
+    slowest = sorted(profile.statements, key=lambda item: item[0], reverse=True)[:SLOW_QUERY_LOG_LIMIT]
+    for seconds, statement in slowest:
+        logger.warning("Slow query %.1f ms in %s %s: %s", seconds * 1000, request.method, request.path, ' '.join(statement.split()))
+
+# Подключение к Flask-приложению; без REQUEST_PROFILING обработчики не регистрируются.
+# Запрос внутри count_queries учитывается в уже открытом профиле.
+def register_profiling(app, api=None):
+    if not REQUEST_PROFILING:
+        return
+    if api is not None:
+        api.representations['application/json'] = timed_representation(api.representations['application/json'])
+
+    @app.before_request
+    def start_profile():
+        g.profiling_started = time.perf_counter()
+        g.profiling_token = _current.set(RequestProfile()) if _current.get() is None else None
+
+    @app.after_request
+    def add_server_timing(response):
+        profile = _current.get()
+        if profile is not None and 'profiling_started' in g:
+            response.headers['Server-Timing'] = profile.server_timing(time.perf_counter() - g.profiling_started)
+        return response
+
+    @app.teardown_request
+    def finish_profile(exc):
+        token = g.pop('profiling_token', None)
+        if token is None:
+            return
+        profile = _current.get()
+        _current.reset(token)
+        if profile.statements:
+            log_slow_statements(profile)
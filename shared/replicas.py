@@ -0,0 +1,134 @@
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from shared.database import engine_options
+import itertools
+import math
+import os
+import threading
+import time
+
+# Чтение с реплик: DB_READ_REPLICAS — адреса реплик базы сервиса через запятую. Запросы GET и
+# HEAD читают обычные SELECT сессии db с реплики, у которой меньше занятых соединений;
+# записи, блокирующие чтения (FOR UPDATE), текстовые инструкции и всё после первой записи
+# в запросе идут в основную базу, как и всё вне запросов (фоновые задачи, запуск).
+# Чтение своих записей: после успешного изменяющего запроса клиент получает cookie, и
+# DB_REPLICA_PIN_SECONDS секунд его чтения идут в основную базу — это время должно покрывать
+# отставание реплик. Клиенты без cookie (другие сервисы) просят основную базу заголовком
+# X-Read-Primary: true, обработчик — вызовом read_from_primary().
+DB_READ_REPLICAS = os.environ.get('DB_READ_REPLICAS', '')
+DB_REPLICA_PIN_SECONDS = float(os.environ.get('DB_REPLICA_PIN_SECONDS', '5'))
+# Реплика, к которой не удалось подключиться, исключается из выбора на это время (сек)
+DB_REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', '30'))
+READ_METHODS = ('GET', 'HEAD')
+PIN_COOKIE = 'read_primary_until'
+PRIMARY_HEADER = 'X-Read-Primary'
+
+class RoutingSession(SignallingSession):
+    """Flask-SQLAlchemy session that sends plain SELECTs of read requests to a replica."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self.info.get('primary') and not self._flushing and is_plain_select(clause):
+            engine = self.db.read_engine()
+            if engine is not None:
+                return engine
+        # После записи или явного обращения к соединению сессия до конца запроса читает
+        # из основной базы, где видны её изменения
+        self.info['primary'] = True
+        return super().get_bind(mapper, clause)
+
+def is_plain_select(clause):
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with read replicas from SQLALCHEMY_READ_REPLICAS (DB_READ_REPLICAS by default)."""
+
+    def __init__(self, *args, **kwargs):
+        self._replica_engines = None
+        self._replica_lock = threading.Lock()
+        self._replica_down_until = {}
+        self._replica_turn = itertools.count()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_READ_REPLICAS', DB_READ_REPLICAS)
+        super().init_app(app)
+        register_replicas(app, self)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    @property
+    def replica_engines(self):
+        # Движки создаются при первом обращении, как и основной: адреса можно поменять в
+        # конфигурации после импорта сервиса
+        if self._replica_engines is None:
+            with self._replica_lock:
+                if self._replica_engines is None:
+                    urls = [url.strip() for url in self.get_app().config['SQLALCHEMY_READ_REPLICAS'].split(',') if url.strip()]
+                    engines = {}
+                    for number, url in enumerate(urls, 1):
+                        engine = create_engine(url, **engine_options(url))
+                        event.listen(engine, 'handle_error', self._replica_failed)
+                        engines[f'replica{number}'] = engine
+                    self._replica_engines = engines
+        return self._replica_engines
+
+    def service_engines(self):
+        return {'default': self.engine, **self.replica_engines}
+
+    def _replica_failed(self, exception_context):
+        if exception_context.is_disconnect or exception_context.connection is None:
+            self._replica_down_until[exception_context.engine] = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+
+    def pick_replica(self):
+        now = time.monotonic()
+        available = [engine for engine in self.replica_engines.values() if self._replica_down_until.get(engine, 0) <= now]
+        if not available:
+            return None
+        # Наименее занятая реплика; из равных — следующая по кругу
+        turn = next(self._replica_turn) % len(available)
+        return min(available[turn:] + available[:turn], key=lambda engine: engine.pool.checkedout())
+
+    def read_engine(self):
+        """Replica engine for the reads of the current request, or None for the primary."""
+        if not has_request_context() or not g.get('read_replica'):
+            return None
+        # Все чтения запроса идут с одной реплики
+        engine = g.get('replica_engine')
+        if engine is None:
+            engine = self.pick_replica()
+            if engine is None:
+                g.read_replica = False
+                return None
+            g.replica_engine = engine
+        return engine
+
+def read_from_primary():
+    """Send the remaining reads of the current request to the primary."""
+    if has_request_context():
+        g.read_replica = False
+
+def pinned_to_primary():
+    if request.headers.get(PRIMARY_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return True
+    try:
+        return float(request.cookies.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def register_replicas(app, db):
+    @app.before_request
+    def route_reads():
+        g.read_replica = request.method in READ_METHODS and bool(db.replica_engines) and not pinned_to_primary()
+
+    @app.after_request
+    def pin_writer(response):
+        if request.method not in READ_METHODS and response.status_code < 400 and db.replica_engines:
+            response.set_cookie(PIN_COOKIE, str(time.time() + DB_REPLICA_PIN_SECONDS),
+                                max_age=math.ceil(DB_REPLICA_PIN_SECONDS), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,94 @@
+from decimal import Decimal
+from flask import make_response, request
+from flask_restx import marshal as restx_marshal
+from functools import wraps
+import gzip
+import orjson
+import os
+
+try:
+    import brotli
+except ImportError:  # br отдаётся только при установленном brotli, иначе — gzip
+    brotli = None
+
+# Быстрая выдача JSON, включается FAST_JSON=true: ответы кодируются orjson, а списки и объекты,
+# описанные моделями Swagger, не проходят marshal поле за полем — словари обработчика только
+# сводятся к ключам модели (лишние отбрасываются, недостающие становятся null). Значения
+# обработчики уже формируют в нужном виде; маска X-Fields в этом режиме не применяется.
+FAST_JSON = os.environ.get('FAST_JSON', 'false').lower() in ('1', 'true', 'yes')
+# Сжатие ответов не меньше COMPRESS_MIN_BYTES по Accept-Encoding: br, затем gzip
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(data):
+    return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+# Представление application/json для flask-restx на orjson
+def output_json(data, code, headers=None):
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
+
+def project(data, model):
+    if isinstance(data, (list, tuple)):
+        return [{key: item.get(key) for key in model} for item in data]
+    return {key: data.get(key) for key in model}
+
+def marshal(data, model):
+    """flask_restx.marshal, or with FAST_JSON only the projection of the data on the model keys."""
+    return project(data, model) if FAST_JSON else restx_marshal(data, model)
+
+def marshal_with(ns, model, as_list=False, **options):
+    """ns.marshal_with that keeps the Swagger documentation but skips marshalling with FAST_JSON."""
+    def wrapper(func):
+        documented = ns.marshal_with(model, as_list=as_list, **options)(func)
+        if not FAST_JSON:
+            return documented
+
+        @wraps(documented)
+        def view(*args, **kwargs):
+            response = func(*args, **kwargs)
+            if isinstance(response, tuple):
+                return (project(response[0], model),) + response[1:]
+            return project(response, model)
+        return view
+    return wrapper
+
+# accept_encodings — разобранный Accept-Encoding (werkzeug Accept); None — без сжатия
+def negotiate_encoding(accept_encodings):
+    return accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL)
+
+# Потоковые ответы и файлы (выгрузка истории уже сжата) не трогаем
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def register_responses(app, api):
+    if FAST_JSON:
+        api.representations['application/json'] = output_json
+    if RESPONSE_COMPRESSION:
+        app.after_request(compress_response)
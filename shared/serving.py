@@ -0,0 +1,84 @@
+from flask import jsonify
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import Pool
+from shared.database import pool_status
+import logging
+import os
+
+# Запуск сервисов. Отладочный сервер (python <service>.py) и gunicorn (shared/gunicorn_conf.py)
+# вызывают одни и те же хуки:
+#   startup      — один раз до приёма запросов; в gunicorn — в мастер-процессе до fork
+#                  (preload_app), например создание схемы базы;
+#   worker_start — в каждом процессе-обработчике: запуск фоновых потоков, которые не
+#                  переживают fork;
+#   worker_exit  — при остановке обработчика.
+_hooks = {'startup': [], 'worker_start': [], 'worker_exit': []}
+_state = {'warm': False}
+
+logger = logging.getLogger('serving')
+
+def on_startup(fn):
+    _hooks['startup'].append(fn)
+    return fn
+
+def on_worker_start(fn):
+    _hooks['worker_start'].append(fn)
+    return fn
+
+def on_worker_exit(fn):
+    _hooks['worker_exit'].append(fn)
+    return fn
+
+def run_hooks(name):
+    for fn in _hooks[name]:
+        fn()
+    if name == 'worker_start':
+        _state['warm'] = True
+
+# Соединения пула не должны переходить через fork: соединение, открытое в мастере, в
+# обработчике закрывается и заменяется новым. Сам движок создаётся Flask-SQLAlchemy лениво,
+# при первом обращении, поэтому у каждого обработчика свой пул.
+@event.listens_for(Pool, 'connect')
+def remember_connection_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+@event.listens_for(Pool, 'checkout')
+def check_connection_pid(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get('pid') != os.getpid():
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError('Connection belongs to another process')
+
+# Проверки живости и готовности для оркестратора. live — процесс отвечает;
+# ready — обработчик прогрет (хуки worker_start выполнены) и база доступна;
+# pool — занятость пулов соединений процесса. engines — функция, возвращающая
+# движки сервиса по именам, по умолчанию основной и реплики (db.service_engines).
+def register_health(app, db, engines=None):
+    def live():
+        return jsonify(status='ok', pid=os.getpid()), 200
+
+    def ready():
+        if not _state['warm']:
+            return jsonify(status='starting', pid=os.getpid()), 503
+        try:
+            db.session.execute(text('SELECT 1'))
+        except exc.SQLAlchemyError:
+            logger.warning('Readiness check failed: database is unavailable', exc_info=True)
+            return jsonify(status='database unavailable', pid=os.getpid()), 503
+        return jsonify(status='ready', pid=os.getpid()), 200
+
+    def pool():
+        current = (engines or db.service_engines)()
+        return jsonify(pid=os.getpid(), pools={name: pool_status(engine) for name, engine in current.items()}), 200
+
+    app.add_url_rule('/health/live', 'health_live', live)
+    app.add_url_rule('/health/ready', 'health_ready', ready)
+    app.add_url_rule('/health/pool', 'health_pool', pool)
+
+# Отладочный сервер Werkzeug. С перезагрузчиком модуль выполняется дважды: в наблюдающем
+# процессе и в дочернем, который обслуживает запросы; фоновые потоки нужны только во втором.
+def run_dev_server(app, port=5000, debug=True):
+    serving_process = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if serving_process:
+        run_hooks('startup')
+        run_hooks('worker_start')
+    app.run(host='0.0.0.0', port=port, debug=debug)
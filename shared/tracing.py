@@ -0,0 +1,97 @@
+from opentelemetry import trace
+from opentelemetry.instrumentation.flask import FlaskInstrumentor
+from opentelemetry.instrumentation.requests import RequestsInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from shared import serving
+import os
+
+# Трассировка OpenTelemetry, включается TRACING=true. Входящие запросы Flask продолжают трассу
+# из заголовка traceparent (W3C), исходящие запросы requests (и aiohttp в асинхронном режиме
+# расписаний) передают его дальше, SQL-инструкции становятся дочерними спанами.
+# TRACE_SAMPLE_RATIO — доля трасс, которые сервис начинает сам; для запросов с traceparent
+# действует решение вызывающего сервиса, так что трасса записывается целиком или никак.
+# TRACE_EXPORTER — file (JSON Lines в TRACE_FILE) или memory (спаны в memory_exporter).
+TRACING = os.environ.get('TRACING', 'false').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE_RATIO = float(os.environ.get('TRACE_SAMPLE_RATIO', '0.01'))
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'file')
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.jsonl')
+# Адреса без трассировки: проверки оркестратора и сбор метрик
+TRACE_EXCLUDED_URLS = '/health/.*,/metrics'
+
+tracer = trace.get_tracer('shared.tracing')
+# Экспортёр TRACE_EXPORTER=memory: get_finished_spans() возвращает записанные спаны
+memory_exporter = None
+
+class JsonLinesSpanExporter(SpanExporter):
+    # Файл открыт с O_APPEND, пачка спанов пишется одним вызовом write, поэтому строки
+    # обработчиков gunicorn, пишущих в общий файл, не перемешиваются
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def export(self, spans):
+        os.write(self.fd, ''.join(span.to_json(indent=None) + '\n' for span in spans).encode())
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        os.close(self.fd)
+
+def configure_tracing(service_name):
+    global memory_exporter
+    if isinstance(trace.get_tracer_provider(), TracerProvider):
+        return
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO))
+    )
+    if TRACE_EXPORTER == 'memory':
+        memory_exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(memory_exporter))
+    else:
+        provider.add_span_processor(BatchSpanProcessor(JsonLinesSpanExporter(TRACE_FILE)))
+    trace.set_tracer_provider(provider)
+    # Накопленные в обработчике спаны записываются до его завершения
+    serving.on_worker_exit(provider.shutdown)
+
+    event.listen(Engine, 'before_cursor_execute', start_query_span)
+    event.listen(Engine, 'after_cursor_execute', end_query_span)
+    event.listen(Engine, 'handle_error', fail_query_span)
+
+# Спан SQL-инструкции открывается только внутри записываемой трассы: вне запроса и в
+# трассах, не попавших в выборку, инструкции ничего не стоят
+def start_query_span(conn, cursor, statement, parameters, context, executemany):
+    if not trace.get_current_span().is_recording():
+        return
+    database = conn.engine.url.database or ''
+    context.tracing_span = tracer.start_span(
+        f'{statement.split(None, 1)[0].upper() if statement.strip() else "SQL"} {database}'.strip(),
+        kind=SpanKind.CLIENT,
+        attributes={'db.system': 'postgresql', 'db.name': database, 'db.statement': statement}
+    )
+
+def end_query_span(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, 'tracing_span', None)
+    if span is not None:
+        span.end()
+        context.tracing_span = None
+
+def fail_query_span(exception_context):
+    span = getattr(exception_context.execution_context, 'tracing_span', None)
+    if span is not None:
+        span.record_exception(exception_context.original_exception)
+        span.set_status(Status(StatusCode.ERROR))
+        span.end()
+        exception_context.execution_context.tracing_span = None
+
+def register_tracing(app, service_name):
+    if not TRACING:
+        return
+    configure_tracing(service_name)
+    FlaskInstrumentor().instrument_app(app, excluded_urls=TRACE_EXCLUDED_URLS)
+    RequestsInstrumentor().instrument()
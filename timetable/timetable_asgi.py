@@ -0,0 +1,331 @@
+from a2wsgi import WSGIMiddleware
+from opentelemetry.instrumentation.aiohttp_client import AioHttpClientInstrumentor
+from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+from opentelemetry.util.http import parse_excluded_urls
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from werkzeug.exceptions import BadRequest
+from werkzeug.http import parse_accept_header
+from shared import metrics, responses, serving, tracing
+from shared.database import engine_options
+from timetable_service import (
+    ACCOUNTS_URL, HOSPITALS_URL, Timetable, app as flask_app, cacheable_days, cached_day_buckets,
+    day_buckets_select, day_versions_bump, day_versions_select, doctor_in_response, logger, parse_datetime,
+    room_in_response, rows_to_day_buckets, store_day_buckets, timetable_from_buckets, timetable_model,
+    timetable_to_dict, timetable_update_model
+)
+import aiohttp
+import asyncio
+import datetime
+import jwt
+import os
+import re
+import time
+
+# Асинхронный режим сервиса расписаний (ASGI):
+#   gunicorn -c shared/gunicorn_conf.py timetable_asgi:app  при WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker
+# Чтение расписания больницы, создание и изменение записи — запросы, которые ждут сервисы
+# аккаунтов и больниц и базу, — обрабатываются в цикле событий: aiohttp для проверки врача и
+# кабинета, asyncpg для базы. Остальные запросы, а также запросы без действительного токена
+# или с некорректными данными — чтобы ответ об ошибке был тем же — и запросы с Idempotency-Key
+# передаются Flask-приложению timetable_service в пуле потоков. Запросы, обслуживаемые здесь,
+# проходят тот же допуск (shared.admission), что и маршруты Flask-приложения.
+ASYNC_UPSTREAM_CONNECTIONS = int(os.environ.get('ASYNC_UPSTREAM_CONNECTIONS', '1000'))
+ASYNC_UPSTREAM_TIMEOUT = float(os.environ.get('ASYNC_UPSTREAM_TIMEOUT', '10'))
+ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', '10'))
+
+# Здесь необходимо использовать действительный токен для межсервисных запросов, как в doctor_exists
+SERVICE_ACCESS_TOKEN = 'your_service_access_token'  # Замените на реальный токен
+
+# Ответ 404 в том же виде, что api.abort(404, ...) Flask-приложения
+def not_found(message):
+    return JSONResponse({'status': 'fail', 'statusCode': '404', 'message': message}, status_code=404)
+
+def authorized(request):
+    auth_header = request.headers.get('Authorization')
+    try:
+        jwt.decode(auth_header.split(" ")[1], flask_app.config['SECRET_KEY'], algorithms=["HS256"])
+    except (AttributeError, IndexError, jwt.InvalidTokenError):
+        return False
+    return True
+
+# Ответ со списком в том же виде, что у Flask-приложения: orjson при FAST_JSON, сжатие
+# больших ответов по Accept-Encoding
+def json_response(request, content):
+    if responses.FAST_JSON:
+        response = Response(responses.dumps(content), media_type='application/json')
+    else:
+        response = JSONResponse(content)
+    if responses.RESPONSE_COMPRESSION and len(response.body) >= responses.COMPRESS_MIN_BYTES:
+        response.headers.append('Vary', 'Accept-Encoding')
+        encoding = responses.negotiate_encoding(parse_accept_header(request.headers.get('accept-encoding')))
+        if encoding:
+            response.body = responses.compress(response.body, encoding)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Content-Length'] = str(len(response.body))
+    return response
+
+# Тело запроса, уже прочитанное обработчиком, заново отдаётся Flask-приложению
+def replay_body(body, receive):
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+    return replay
+
+class TimetableASGI:
+    def __init__(self, wsgi_app):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=ASYNC_WSGI_THREADS)
+        self.engine = None
+        self.client = None
+        self.routes = [
+            ('GET', '/api/Timetable', re.compile(r'/api/Timetable'), self.list_timetables),
+            ('POST', '/api/Timetable', re.compile(r'/api/Timetable'), self.create_timetable),
+            ('PUT', '/api/Timetable/<int:id>', re.compile(r'/api/Timetable/(?P<id>\d+)'), self.update_timetable),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            for method, route, pattern, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match and scope['method'] == method:
+                    # Метрики передаваемых во Flask запросов снимает само Flask-приложение
+                    started = time.perf_counter()
+                    metrics.REQUESTS_IN_FLIGHT.inc()
+                    request = Request(scope, receive)
+                    request.state.route = route
+                    try:
+                        body = await request.body() if method != 'GET' else None
+                        response = await handler(request, **match.groupdict())
+                        if response is not None:
+                            await response(scope, receive, send)
+                            metrics.observe_request(method, route, response.status_code, time.perf_counter() - started)
+                            return
+                    except Exception:
+                        metrics.observe_request(method, route, 500, time.perf_counter() - started)
+                        raise
+                    finally:
+                        metrics.REQUESTS_IN_FLIGHT.dec()
+                        admitted = getattr(request.state, 'admission', None)
+                        if admitted is not None:
+                            limit, admitted_at = admitted
+                            limit.release(time.perf_counter() - admitted_at)
+                    if body is not None:
+                        receive = replay_body(body, receive)
+                    break
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Движок и HTTP-клиент привязаны к циклу событий процесса и создаются в нём же
+    def start(self):
+        if self.engine is not None:
+            return
+        url = make_url(flask_app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql+asyncpg')
+        self.engine = create_async_engine(url, **engine_options(url))
+        self.client = aiohttp.ClientSession(
+            headers={'Authorization': f'Bearer {SERVICE_ACCESS_TOKEN}'},
+            timeout=aiohttp.ClientTimeout(total=ASYNC_UPSTREAM_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=ASYNC_UPSTREAM_CONNECTIONS)
+        )
+
+    async def stop(self):
+        if self.engine is None:
+            return
+        await self.client.close()
+        await self.engine.dispose()
+        self.engine = self.client = None
+
+    # Допуск запроса, который точно обслуживается здесь: переданный во Flask проверяется там.
+    # Ожидание в очереди предела — в потоке, чтобы не останавливать цикл событий.
+    # None, если запрос допущен, иначе ответ 429 или 503.
+    async def admit(self, request):
+        control = flask_app.extensions.get('admission')
+        if control is None:
+            return None
+        endpoint_class = control.endpoint_class(request.method, request.state.route)
+        remote_addr = request.client.host if request.client else None
+        rejected = control.rate_limited(endpoint_class, request.headers.get('Authorization'), remote_addr)
+        limit = control.limits.get(endpoint_class)
+        if rejected is None and limit is not None:
+            retry_after = None if limit.try_acquire() else await asyncio.to_thread(limit.acquire)
+            if retry_after is None:
+                request.state.admission = (limit, time.perf_counter())
+            else:
+                rejected = control.overloaded(endpoint_class, retry_after)
+        if rejected is None:
+            return None
+        body, status, headers = rejected
+        return JSONResponse(body, status_code=status, headers=headers)
+
+    async def doctor_exists(self, doctor_id):
+        try:
+            logger.debug("Checking existence of doctor with ID: %s", doctor_id)
+            started = time.perf_counter()
+            async with self.client.get(f'{ACCOUNTS_URL}/api/Accounts/{doctor_id}') as response:
+                content = await response.read()
+            metrics.observe_upstream('accounts', response.status, time.perf_counter() - started)
+            return doctor_in_response(doctor_id, response.status, content)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.observe_upstream('accounts', 'error', time.perf_counter() - started)
+            logger.error("Error connecting to Accounts Service: %s", e)
+            return False
+
+    async def room_exists(self, hospital_id, room):
+        try:
+            logger.debug("Checking existence of room '%s' in hospital ID: %s", room, hospital_id)
+            started = time.perf_counter()
+            async with self.client.get(f'{HOSPITALS_URL}/api/Hospitals/{hospital_id}/Rooms') as response:
+                content = await response.read()
+            metrics.observe_upstream('hospitals', response.status, time.perf_counter() - started)
+            return room_in_response(hospital_id, room, response.status, content)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.observe_upstream('hospitals', 'error', time.perf_counter() - started)
+            logger.error("Error connecting to Hospital Service: %s", e)
+            return False
+
+    # GET /api/Timetable: то же, что TimetableList.get, потоковая выдача — во Flask
+    async def list_timetables(self, request):
+        args = request.query_params
+        if not authorized(request) or args.get('stream'):
+            return None
+        try:
+            hospital_id = int(args['hospitalId'])
+            from_date = datetime.datetime.strptime(args['fromDate'], "%Y-%m-%d")
+            to_date = datetime.datetime.strptime(args['toDate'], "%Y-%m-%d")
+        except (KeyError, ValueError):
+            return None
+        rejected = await self.admit(request)
+        if rejected is not None:
+            return rejected
+        self.start()
+
+        days = cacheable_days(from_date, to_date)
+        if days is None:
+            table = Timetable.__table__
+            async with self.engine.connect() as conn:
+                rows = await conn.execute(select(table).where(
+                    table.c.hospital_id == hospital_id,
+                    table.c.start_time >= from_date,
+                    table.c.end_time <= to_date
+                ))
+                output = [timetable_to_dict(t) for t in rows]
+        else:
+            async with self.engine.connect() as conn:
+                versions = dict((await conn.execute(day_versions_select(hospital_id, days[0], days[-1]))).all())
+                buckets, missing = cached_day_buckets(hospital_id, days, versions)
+                if missing:
+                    loaded = rows_to_day_buckets(await conn.execute(day_buckets_select(hospital_id, missing[0], missing[-1])))
+                    store_day_buckets(hospital_id, buckets, missing, loaded, versions)
+            output = timetable_from_buckets(days, buckets, to_date)
+        return json_response(request, responses.marshal(output, timetable_model))
+
+    # POST /api/Timetable: то же, что TimetableList.post; врач и кабинет проверяются параллельно
+    async def create_timetable(self, request):
+        if not authorized(request) or 'Idempotency-Key' in request.headers:
+            return None
+        try:
+            data = await request.json()
+            timetable_model.validate(data)
+            start_time = parse_datetime(data['from'])
+            end_time = parse_datetime(data['to'])
+        except (ValueError, BadRequest):
+            return None
+        rejected = await self.admit(request)
+        if rejected is not None:
+            return rejected
+        self.start()
+
+        doctor_found, room_found = await asyncio.gather(
+            self.doctor_exists(data['doctorId']), self.room_exists(data['hospitalId'], data['room'])
+        )
+        if not doctor_found:
+            return not_found('Doctor not found')
+        if not room_found:
+            return not_found('Room not found')
+
+        async with self.engine.begin() as conn:
+            await conn.execute(Timetable.__table__.insert().values(
+                hospital_id=data['hospitalId'],
+                doctor_id=data['doctorId'],
+                start_time=start_time,
+                end_time=end_time,
+                room=data['room']
+            ))
+            await conn.execute(day_versions_bump([(data['hospitalId'], start_time.date())]))
+        return JSONResponse({'message': 'Timetable entry created successfully'}, status_code=201)
+
+    # PUT /api/Timetable/<id>: то же, что TimetableResource.put
+    async def update_timetable(self, request, id):
+        if not authorized(request):
+            return None
+        try:
+            data = await request.json()
+            timetable_update_model.validate(data)
+            values = {}
+            if 'from' in data:
+                values['start_time'] = parse_datetime(data['from'])
+            if 'to' in data:
+                values['end_time'] = parse_datetime(data['to'])
+        except (ValueError, BadRequest):
+            return None
+        rejected = await self.admit(request)
+        if rejected is not None:
+            return rejected
+        self.start()
+
+        table = Timetable.__table__
+        async with self.engine.connect() as conn:
+            timetable = (await conn.execute(
+                select(table.c.hospital_id, table.c.start_time).where(table.c.id == int(id))
+            )).first()
+        if timetable is None:
+            return not_found('Timetable not found')
+        if 'room' in data:
+            if not await self.room_exists(timetable.hospital_id, data['room']):
+                return not_found('Room not found')
+            values['room'] = data['room']
+
+        if values:
+            async with self.engine.begin() as conn:
+                updated = (await conn.execute(
+                    table.update().where(table.c.id == int(id)).values(**values).returning(table.c.start_time)
+                )).first()
+                if updated is not None:
+                    await conn.execute(day_versions_bump([
+                        (timetable.hospital_id, timetable.start_time.date()), (timetable.hospital_id, updated.start_time.date())
+                    ]))
+            if updated is None:
+                return not_found('Timetable not found')
+        return JSONResponse({'message': 'Timetable updated successfully'})
+
+app = TimetableASGI(flask_app)
+# Запросы, обработанные в цикле событий, получают спан здесь, переданные Flask — и в нём;
+# вызовы сервисов через aiohttp передают traceparent
+if tracing.TRACING:
+    AioHttpClientInstrumentor().instrument()
+    app = OpenTelemetryMiddleware(app, excluded_urls=parse_excluded_urls(tracing.TRACE_EXCLUDED_URLS))
+
+if __name__ == '__main__':
+    import uvicorn
+    serving.run_hooks('startup')
+    serving.run_hooks('worker_start')
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -1,16 +1,114 @@
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_restx import Api, Resource, fields, Namespace
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask_restx import Api, Resource, fields, Namespace, inputs, marshal
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from functools import wraps
+from collections import OrderedDict
+from shared import admission, metrics, profiling, replicas, responses, serving, tracing
+from shared.database import engine_options
+from shared.idempotency import IdempotencyStore
+from shared.replicas import RoutingSQLAlchemy
+from shared.jobs import JobRunner
+from logging.handlers import QueueHandler, QueueListener
+import atexit
 import jwt
 import datetime
+import json
 import os
+import queue
+import random
+import threading
+import time
 import requests  # Для взаимодействия с другими микросервисами
 from dateutil import parser  # Для парсинга ISO дат с 'Z'
 import logging
 
-# Настройка логирования
-logging.basicConfig(level=logging.DEBUG)
+# Настройка логирования через переменные окружения:
+# LOG_LEVEL — уровень (по умолчанию INFO), LOG_FORMAT — json или text,
+# LOG_DEBUG_SAMPLE_RATE — доля сохраняемых debug-сообщений,
+# LOG_ASYNC — запись через очередь в отдельном потоке, чтобы запросы не ждали вывода
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+LOG_ASYNC = os.environ.get('LOG_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+
+# Структурированный вывод: одна JSON-строка на запись, поля из extra={'fields': {...}}
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        payload.update(getattr(record, 'fields', {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exception'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+# Выборочное сохранение debug-сообщений; сообщения уровня INFO и выше проходят всегда
+class DebugSampler(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+# Обработчик очереди: текст сообщения и исключения собирается в потоке запроса, пока
+# аргументы не изменились, а JSON и вывод остаются потоку QueueListener
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Копия через __dict__: copy.copy импортирует модули и ломается при завершении интерпретатора
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if isinstance(getattr(record, 'fields', None), dict):
+            record.fields = dict(record.fields)
+        return record
+
+# Поток QueueListener не переживает fork, поэтому запоминается процесс, который его запустил
+def start_log_listener(log_queue, *handlers):
+    global log_listener, log_listener_pid
+    log_listener = QueueListener(log_queue, *handlers)
+    log_listener.start()
+    log_listener_pid = os.getpid()
+
+def stop_log_listener():
+    if log_listener and log_listener_pid == os.getpid():
+        log_listener.stop()
+
+def configure_logging():
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    
+    if LOG_ASYNC:
+        log_queue = queue.SimpleQueue()
+        start_log_listener(log_queue, handler)
+        atexit.register(stop_log_listener)
+        root_handler = DeferredQueueHandler(log_queue)
+    else:
+        root_handler = handler
+    if LOG_DEBUG_SAMPLE_RATE < 1.0:
+        root_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    
+    root = logging.getLogger()
+    root.handlers[:] = [root_handler]
+    root.setLevel(LOG_LEVEL)
+
+log_listener = None
+log_listener_pid = None
+configure_logging()
+logger = logging.getLogger('timetable')
 
 app = Flask(__name__)
 
@@ -24,8 +122,33 @@ db_name = os.environ.get('POSTGRES_DB', 'timetable_db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Отключаем предупреждение
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your_secret_key')  # Используйте переменные окружения для секретных ключей
+# Сообщение 404 без подсказки flask-restx о похожих адресах: ответ ASGI-режима собирается так же
+app.config['RESTX_ERROR_404_HELP'] = False
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+db = RoutingSQLAlchemy(app)
+serving.register_health(app, db)
+metrics.register_metrics(app, db)
+
+# Потоковая выдача расписаний: размер пачки строк серверного курсора и поддерживаемые форматы
+STREAM_BATCH_SIZE = int(os.environ.get('TIMETABLE_STREAM_BATCH_SIZE', '1000'))
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+# Кэш расписаний по дням: максимальное число дней в кэше, время жизни дня (сек) и
+# максимальная длина периода, который собирается из кэша (более длинные идут в базу напрямую)
+TIMETABLE_CACHE_MAX_DAYS = int(os.environ.get('TIMETABLE_CACHE_MAX_DAYS', '10000'))
+TIMETABLE_CACHE_TTL = float(os.environ.get('TIMETABLE_CACHE_TTL', '60'))
+TIMETABLE_CACHE_MAX_RANGE_DAYS = int(os.environ.get('TIMETABLE_CACHE_MAX_RANGE_DAYS', '62'))
 
-db = SQLAlchemy(app)
+# Размер пачки при массовом удалении и архивации записей расписания
+CLEANUP_BATCH_SIZE = int(os.environ.get('TIMETABLE_CLEANUP_BATCH_SIZE', '5000'))
+
+# Адреса сервисов аккаунтов и больниц для проверки врачей и кабинетов
+ACCOUNTS_URL = os.environ.get('ACCOUNTS_URL', 'http://localhost:5001').rstrip('/')
+HOSPITALS_URL = os.environ.get('HOSPITALS_URL', 'http://localhost:5002').rstrip('/')
 
 # Инициализация Flask-RESTx Api
 authorizations = {
@@ -45,6 +168,17 @@ api = Api(
     authorizations=authorizations,
     security='Bearer Auth'
 )
+responses.register_responses(app, api)
+profiling.register_profiling(app, api)
+tracing.register_tracing(app, 'timetable')
+# Дорогие операции — создание и изменение записей с проверкой врача и кабинета в других
+# сервисах и массовое удаление расписаний
+admission.register_admission(app, classes={
+    ('POST', '/api/Timetable'): 'expensive',
+    ('PUT', '/api/Timetable/<int:id>'): 'expensive',
+    ('DELETE', '/api/Timetable/Hospital/<int:hospital_id>'): 'expensive',
+    ('DELETE', '/api/Timetable/Doctor/<int:doctor_id>'): 'expensive',
+})
 
 # Создание Namespace для расписаний
 ns = Namespace('Timetables', description='Операции с расписаниями', path='/api/Timetable')
@@ -78,6 +212,34 @@ error_model = api.model('Error', {
     'message': fields.String(description='Сообщение об ошибке')
 })
 
+# Модель статистики кэша расписаний
+cache_stats_model = api.model('TimetableCacheStats', {
+    'size': fields.Integer(description='Количество дней в кэше'),
+    'maxSize': fields.Integer(description='Максимальное количество дней в кэше'),
+    'hits': fields.Integer(description='Попадания'),
+    'misses': fields.Integer(description='Промахи'),
+    'hitRate': fields.Float(description='Доля попаданий'),
+    'evictions': fields.Integer(description='Вытеснения'),
+    'invalidations': fields.Integer(description='Инвалидации')
+})
+
+# Модель результата массового удаления
+cleanup_result_model = api.model('TimetableCleanupResult', {
+    'message': fields.String(description='Сообщение'),
+    'affected': fields.Integer(description='Количество удалённых или перенесённых в архив записей'),
+    'archived': fields.Boolean(description='Записи перенесены в архив')
+})
+
+# Модель статистики загрузки кабинетов и врачей
+utilization_model = api.model('TimetableUtilization', {
+    'room': fields.String(description='Кабинет (при группировке по кабинетам)'),
+    'doctorId': fields.Integer(description='ID врача (при группировке по врачам)'),
+    'period': fields.String(description='Начало периода (день или неделя)'),
+    'entries': fields.Integer(description='Количество записей'),
+    'bookedHours': fields.Float(description='Сумма часов по всем записям'),
+    'occupiedHours': fields.Float(description='Часы занятости без учёта пересечений записей')
+})
+
 # Модель данных для расписания в базе данных
 class Timetable(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -87,29 +249,70 @@ class Timetable(db.Model):
     end_time = db.Column(db.DateTime, nullable=False)
     room = db.Column(db.String(50), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_timetable_hospital_start', 'hospital_id', 'start_time'),
+        db.Index('ix_timetable_doctor', 'doctor_id'),
+    )
+
+# Архив записей расписания удалённых врачей и больниц
+class TimetableArchive(db.Model):
+    __tablename__ = 'timetable_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    hospital_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    room = db.Column(db.String(50), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+# Версии дней расписания больницы для кэша: каждая запись увеличивает версию своих дней
+# в той же транзакции, поэтому изменение видно кэшам всех процессов сразу после фиксации
+class TimetableDayVersion(db.Model):
+    __tablename__ = 'timetable_day_version'
+    hospital_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+
+# Сохранённые ответы запросов с заголовком Idempotency-Key
+idempotency = IdempotencyStore(db, error=lambda code, message: api.abort(code, message, status='fail', statusCode=str(code)))
+
+# Проверка JWT токена запроса: возвращает его содержимое или прерывает запрос с ошибкой
+def decode_token():
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        logger.debug("Authorization header is missing.")
+        api.abort(403, 'Token is missing', status='fail', statusCode="403")
+    
+    try:
+        token = auth_header.split(" ")[1]
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        logger.debug("Token decoded successfully for user %s", data.get('user_id'))
+    except IndexError:
+        logger.debug("Authorization header format is invalid.")
+        api.abort(403, 'Token is invalid', status='fail', statusCode="403")
+    except jwt.ExpiredSignatureError:
+        logger.debug("Token has expired.")
+        api.abort(401, 'Token expired', status='fail', statusCode="401")
+    except jwt.InvalidTokenError:
+        logger.debug("Token is invalid.")
+        api.abort(403, 'Token is invalid', status='fail', statusCode="403")
+    return data
+
 # Декоратор для проверки JWT токена
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            logging.debug("Authorization header is missing.")
-            api.abort(403, 'Token is missing', status='fail', statusCode="403")
-        
-        try:
-            token = auth_header.split(" ")[1]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            logging.debug(f"Token decoded successfully: {data}")
-        except IndexError:
-            logging.debug("Authorization header format is invalid.")
-            api.abort(403, 'Token is invalid', status='fail', statusCode="403")
-        except jwt.ExpiredSignatureError:
-            logging.debug("Token has expired.")
-            api.abort(401, 'Token expired', status='fail', statusCode="401")
-        except jwt.InvalidTokenError:
-            logging.debug("Token is invalid.")
-            api.abort(403, 'Token is invalid', status='fail', statusCode="403")
-        
+        decode_token()
+        return f(*args, **kwargs)
+    
+    return decorated
+
+# Декоратор для проверки прав администратора
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if 'Admin' not in decode_token().get('roles', []):
+            api.abort(403, 'Permission denied', status='fail', statusCode="403")
         return f(*args, **kwargs)
     
     return decorated
@@ -117,7 +320,7 @@ def token_required(f):
 # Проверка, существует ли врач
 def doctor_exists(doctor_id):
     try:
-        logging.debug(f"Checking existence of doctor with ID: {doctor_id}")
+        logger.debug("Checking existence of doctor with ID: %s", doctor_id)
         
         # Здесь необходимо использовать действительный токен для межсервисных запросов
         # Например, сервисный токен или другой механизм аутентификации
@@ -127,33 +330,40 @@ def doctor_exists(doctor_id):
             'Authorization': f'Bearer {service_access_token}'
         }
         
-        response = requests.get(f'http://localhost:5001/api/Accounts/{doctor_id}', headers=headers)
-        logging.debug(f"Received response: {response.status_code} - {response.text}")
-        
-        if response.status_code == 200:
-            user_data = response.json()
-            roles = user_data.get('roles', [])
-            
-            # Если roles хранится как строка, разделённая запятыми
-            if isinstance(roles, str):
-                roles = roles.split(',')
-            
-            logging.debug(f"User roles: {roles}")
-            return 'Doctor' in roles
-        elif response.status_code == 404:
-            logging.debug(f"Doctor with ID {doctor_id} not found.")
-            return False
-        else:
-            logging.error(f"Unexpected response from Accounts Service: {response.status_code}")
-            return False
+        started = time.perf_counter()
+        response = requests.get(f'{ACCOUNTS_URL}/api/Accounts/{doctor_id}', headers=headers)
+        metrics.observe_upstream('accounts', response.status_code, time.perf_counter() - started)
+        return doctor_in_response(doctor_id, response.status_code, response.content)
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error connecting to Accounts Service: {e}")
+        metrics.observe_upstream('accounts', 'error', time.perf_counter() - started)
+        logger.error("Error connecting to Accounts Service: %s", e)
+        return False
+
+# Разбор ответа сервиса аккаунтов; общий для синхронного клиента и timetable_asgi
+def doctor_in_response(doctor_id, status_code, content):
+    logger.debug("Received response: %s (%s bytes)", status_code, len(content))
+    
+    if status_code == 200:
+        user_data = json.loads(content)
+        roles = user_data.get('roles', [])
+        
+        # Если roles хранится как строка, разделённая запятыми
+        if isinstance(roles, str):
+            roles = roles.split(',')
+        
+        logger.debug("User roles: %s", roles)
+        return 'Doctor' in roles
+    elif status_code == 404:
+        logger.debug("Doctor with ID %s not found.", doctor_id)
+        return False
+    else:
+        logger.error("Unexpected response from Accounts Service: %s", status_code)
         return False
 
 # Проверка, существует ли комната
 def room_exists(hospital_id, room):
     try:
-        logging.debug(f"Checking existence of room '{room}' in hospital ID: {hospital_id}")
+        logger.debug("Checking existence of room '%s' in hospital ID: %s", room, hospital_id)
         
         # Здесь необходимо использовать действительный токен для межсервисных запросов
         # Например, сервисный токен или другой механизм аутентификации
@@ -163,24 +373,347 @@ def room_exists(hospital_id, room):
             'Authorization': f'Bearer {service_access_token}'
         }
         
-        response = requests.get(f'http://localhost:5002/api/Hospitals/{hospital_id}/Rooms', headers=headers)
-        logging.debug(f"Received response: {response.status_code} - {response.text}")
-        
-        if response.status_code == 200:
-            rooms = response.json()
-            exists = any(r['name'] == room for r in rooms)
-            logging.debug(f"Room '{room}' exists: {exists}")
-            return exists
-        elif response.status_code == 404:
-            logging.debug(f"Hospital with ID {hospital_id} not found.")
-            return False
-        else:
-            logging.error(f"Unexpected response from Hospital Service: {response.status_code}")
-            return False
+        started = time.perf_counter()
+        response = requests.get(f'{HOSPITALS_URL}/api/Hospitals/{hospital_id}/Rooms', headers=headers)
+        metrics.observe_upstream('hospitals', response.status_code, time.perf_counter() - started)
+        return room_in_response(hospital_id, room, response.status_code, response.content)
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error connecting to Hospital Service: {e}")
+        metrics.observe_upstream('hospitals', 'error', time.perf_counter() - started)
+        logger.error("Error connecting to Hospital Service: %s", e)
+        return False
+
+# Разбор ответа сервиса больниц со списком кабинетов
+def room_in_response(hospital_id, room, status_code, content):
+    logger.debug("Received response: %s (%s bytes)", status_code, len(content))
+    
+    if status_code == 200:
+        rooms = json.loads(content)
+        exists = any(r['name'] == room for r in rooms)
+        logger.debug("Room '%s' exists: %s", room, exists)
+        return exists
+    elif status_code == 404:
+        logger.debug("Hospital with ID %s not found.", hospital_id)
+        return False
+    else:
+        logger.error("Unexpected response from Hospital Service: %s", status_code)
         return False
 
+# Преобразование записи расписания (модели или строки выборки) в словарь ответа
+def timetable_to_dict(t):
+    return {
+        'id': t.id,
+        'hospitalId': t.hospital_id,
+        'doctorId': t.doctor_id,
+        'from': t.start_time.isoformat(),
+        'to': t.end_time.isoformat(),
+        'room': t.room
+    }
+
+# Время записи в ISO-формате. Столбцы хранят время без часового пояса: время со смещением
+# приводится к UTC, чтобы запись не зависела от часового пояса сессии базы и совпадала в
+# обычном и асинхронном режимах
+def parse_datetime(value):
+    parsed = parser.isoparse(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+# Разбор периода запроса в формате YYYY-MM-DD
+def parse_date_range(from_date_str, to_date_str):
+    try:
+        from_date = datetime.datetime.strptime(from_date_str, "%Y-%m-%d")
+        to_date = datetime.datetime.strptime(to_date_str, "%Y-%m-%d")
+    except ValueError:
+        api.abort(400, 'Invalid date format. Use YYYY-MM-DD', status='fail', statusCode="400")
+    return from_date, to_date
+
+# Запрос расписания больницы за период
+def hospital_timetable_query(hospital_id, from_date, to_date):
+    return Timetable.query.filter(
+        Timetable.hospital_id == hospital_id,
+        Timetable.start_time >= from_date,
+        Timetable.end_time <= to_date
+    )
+
+# Потоковая выдача расписания в формате NDJSON или JSON-массива.
+# Строки читаются пачками через серверный курсор, без построения полного списка в памяти.
+def stream_timetables(query, stream_format):
+    rows = query.with_entities(
+        Timetable.id,
+        Timetable.hospital_id,
+        Timetable.doctor_id,
+        Timetable.start_time,
+        Timetable.end_time,
+        Timetable.room
+    ).yield_per(STREAM_BATCH_SIZE)
+
+    def generate():
+        if stream_format == 'json':
+            yield '['
+        buffer = []
+        count = 0
+        for row in rows:
+            item = json.dumps(timetable_to_dict(row), ensure_ascii=False)
+            if stream_format == 'ndjson':
+                buffer.append(item + '\n')
+            else:
+                buffer.append(item if count == 0 else ',' + item)
+            count += 1
+            if len(buffer) >= STREAM_BATCH_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+        if stream_format == 'json':
+            buffer.append(']')
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[stream_format])
+
+# Кэш сериализованных записей расписания по ключу (hospital_id, дата начала).
+# Вытеснение по LRU при превышении max_days, устаревание по ttl.
+# Кэш локален для процесса, а версии дней хранятся в timetable_day_version: чтение сверяет
+# версии периода одним запросом к основной базе, и день, изменённый в любом процессе,
+# загружается заново. Счётчики отдаются в /metrics (cache_lookups_total и др.).
+class TimetableDayCache:
+    name = 'timetable_days'
+
+    def __init__(self, max_days, ttl):
+        self.max_days = max_days
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop(self, key, reason):
+        del self._buckets[key]
+        metrics.CACHE_EVICTIONS.labels(self.name, reason).inc()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is not None and self.ttl and entry[0] < time.monotonic():
+                self._drop(key, 'expired')
+                entry = None
+            elif entry is not None and entry[1] != version:
+                self._drop(key, 'stale')
+                self.invalidations += 1
+                entry = None
+            metrics.CACHE_ENTRIES.labels(self.name).set(len(self._buckets))
+            if entry is None:
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.labels(self.name, 'miss').inc()
+                return None
+            self._buckets.move_to_end(key)
+            self.hits += 1
+            metrics.CACHE_LOOKUPS.labels(self.name, 'hit').inc()
+            return entry[2]
+
+    # version — версия дня, прочитанная до загрузки строк: если день успели изменить,
+    # запись в кэше окажется устаревшей и при следующем чтении загрузится заново
+    def put(self, key, bucket, version):
+        if self.max_days <= 0:
+            return
+        with self._lock:
+            self._buckets[key] = (time.monotonic() + self.ttl, version, bucket)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_days:
+                self._drop(next(iter(self._buckets)), 'lru')
+                self.evictions += 1
+            metrics.CACHE_ENTRIES.labels(self.name).set(len(self._buckets))
+
+    def stats(self):
+        with self._lock:
+            requests_total = self.hits + self.misses
+            return {
+                'size': len(self._buckets),
+                'maxSize': self.max_days,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / requests_total if requests_total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+timetable_cache = TimetableDayCache(TIMETABLE_CACHE_MAX_DAYS, TIMETABLE_CACHE_TTL)
+
+def day_versions_select(hospital_id, first_day, last_day):
+    table = TimetableDayVersion.__table__
+    return select(table.c.day, table.c.version).where(
+        table.c.hospital_id == hospital_id, table.c.day >= first_day, table.c.day <= last_day
+    )
+
+# Увеличение версий дней (hospital_id, day); выполняется в транзакции записи. Дни
+# упорядочены, чтобы параллельные записи блокировали строки версий в одном порядке.
+def day_versions_bump(keys):
+    table = TimetableDayVersion.__table__
+    insert = pg_insert(table).values([
+        {'hospital_id': hospital_id, 'day': day, 'version': 1} for hospital_id, day in sorted(set(keys))
+    ])
+    return insert.on_conflict_do_update(index_elements=['hospital_id', 'day'], set_={'version': table.c.version + 1})
+
+# Выборка дней [first_day, last_day] одним запросом; строки разбиваются по дню начала
+def day_buckets_select(hospital_id, first_day, last_day):
+    table = Timetable.__table__
+    return select(table).where(
+        table.c.hospital_id == hospital_id,
+        table.c.start_time >= datetime.datetime.combine(first_day, datetime.time.min),
+        table.c.start_time < datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min)
+    ).order_by(table.c.start_time, table.c.id)
+
+def rows_to_day_buckets(rows):
+    buckets = {}
+    for t in rows:
+        buckets.setdefault(t.start_time.date(), []).append((t.end_time, timetable_to_dict(t)))
+    return buckets
+
+# Версии и дни для кэша читаются из основной базы: день, прочитанный с отстающей реплики
+# сразу после записи, лёг бы в кэш с новой версией, но старыми строками
+def load_day_versions(hospital_id, first_day, last_day):
+    replicas.read_from_primary()
+    return dict(db.session.execute(day_versions_select(hospital_id, first_day, last_day)).all())
+
+def load_day_buckets(hospital_id, first_day, last_day):
+    replicas.read_from_primary()
+    return rows_to_day_buckets(db.session.execute(day_buckets_select(hospital_id, first_day, last_day)))
+
+# Дни периода, которые собираются из кэша, или None, если период для кэша слишком длинный
+def cacheable_days(from_date, to_date):
+    days_count = (to_date.date() - from_date.date()).days + 1
+    if days_count > TIMETABLE_CACHE_MAX_RANGE_DAYS or TIMETABLE_CACHE_MAX_DAYS <= 0:
+        return None
+    return [from_date.date() + datetime.timedelta(days=n) for n in range(days_count)]
+
+def cached_day_buckets(hospital_id, days, versions):
+    buckets = {}
+    missing = []
+    for day in days:
+        bucket = timetable_cache.get((hospital_id, day), versions.get(day, 0))
+        if bucket is None:
+            missing.append(day)
+        else:
+            buckets[day] = bucket
+    return buckets, missing
+
+def store_day_buckets(hospital_id, buckets, missing, loaded, versions):
+    for day in missing:
+        bucket = tuple(loaded.get(day, ()))
+        buckets[day] = bucket
+        timetable_cache.put((hospital_id, day), bucket, versions.get(day, 0))
+
+# Записи, начавшиеся в период, но закончившиеся после его конца, в ответ не попадают
+def timetable_from_buckets(days, buckets, to_date):
+    return [item for day in days for end_time, item in buckets[day] if end_time <= to_date]
+
+# Расписание больницы за период, собранное из дневных записей кэша
+def cached_hospital_timetable(hospital_id, from_date, to_date):
+    days = cacheable_days(from_date, to_date)
+    if days is None:
+        return [timetable_to_dict(t) for t in hospital_timetable_query(hospital_id, from_date, to_date).all()]
+    
+    versions = load_day_versions(hospital_id, days[0], days[-1])
+    buckets, missing = cached_day_buckets(hospital_id, days, versions)
+    if missing:
+        loaded = load_day_buckets(hospital_id, missing[0], missing[-1])
+        store_day_buckets(hospital_id, buckets, missing, loaded, versions)
+    
+    return timetable_from_buckets(days, buckets, to_date)
+
+# Массовое удаление записей, подходящих под условия, с переносом в архив при archive=True.
+# Каждая пачка — одна инструкция DELETE ... RETURNING (или INSERT ... SELECT из неё) в
+# отдельной короткой транзакции, поэтому блокировки не держатся на всё время очистки.
+def purge_timetables(conditions, archive=False, progress=None):
+    table = Timetable.__table__
+    archive_table = TimetableArchive.__table__
+    columns = ('id', 'hospital_id', 'doctor_id', 'start_time', 'end_time', 'room')
+    affected = 0
+    
+    while True:
+        batch_ids = select(table.c.id).where(*conditions).limit(CLEANUP_BATCH_SIZE).scalar_subquery()
+        deleted = table.delete().where(table.c.id.in_(batch_ids))
+        if archive:
+            moved = deleted.returning(*[table.c[name] for name in columns]).cte('moved')
+            statement = archive_table.insert().from_select(
+                columns, select(*[moved.c[name] for name in columns])
+            ).returning(archive_table.c.hospital_id, archive_table.c.start_time)
+        else:
+            statement = deleted.returning(table.c.hospital_id, table.c.start_time)
+        
+        rows = db.session.execute(statement).fetchall()
+        if not rows:
+            db.session.commit()
+            break
+        db.session.execute(day_versions_bump((row.hospital_id, row.start_time.date()) for row in rows))
+        db.session.commit()
+        
+        affected += len(rows)
+        logger.info("Timetable cleanup batch removed %s entries (archive=%s).", len(rows), archive)
+        if progress:
+            progress(affected)
+    
+    return affected
+
+# Условия очистки расписания больницы (за период или целиком) или врача
+def timetable_purge_conditions(params):
+    if params.get('doctorId') is not None:
+        return [Timetable.doctor_id == params['doctorId']]
+    conditions = [Timetable.hospital_id == params['hospitalId']]
+    if params.get('fromDate') or params.get('toDate'):
+        if not (params.get('fromDate') and params.get('toDate')):
+            api.abort(400, 'Both fromDate and toDate are required for a range cleanup', status='fail', statusCode="400")
+        from_date, to_date = parse_date_range(params.get('fromDate'), params.get('toDate'))
+        conditions += [Timetable.start_time >= from_date, Timetable.end_time <= to_date]
+    return conditions
+
+# Фоновые задачи сервиса: очистка большого расписания не держит запрос и выполняется
+# с ограниченной параллельностью; состояние — GET /api/Jobs/<job_id>
+jobs = JobRunner(app, db)
+job_model = jobs.register_routes(api, decorators=[admin_required])
+
+@jobs.task('timetable_purge')
+def run_timetable_purge(job, params):
+    affected = purge_timetables(timetable_purge_conditions(params), archive=params['archive'], progress=job.progress)
+    logger.info("Background cleanup %s removed %s timetable entries.", job.id, affected)
+    return {'affected': affected, 'archived': params['archive']}
+
+# Статистика загрузки считается в базе. Окно max(end_time) по предыдущим записям ключа
+# даёт момент, до которого ключ уже занят, поэтому occupied_hours — длина объединения
+# интервалов, а booked_hours — простая сумма длительностей.
+UTILIZATION_GROUPS = {
+    'room': 'room',
+    'doctor': 'doctor_id',
+}
+UTILIZATION_PERIODS = ('day', 'week')
+
+def utilization_sql(group_by):
+    key = UTILIZATION_GROUPS[group_by]
+    return text(f"""
+        WITH ordered AS (
+            SELECT {key} AS group_key, start_time, end_time,
+                   max(end_time) OVER (
+                       PARTITION BY {key} ORDER BY start_time, end_time
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) AS covered_until
+            FROM {Timetable.__tablename__}
+            WHERE hospital_id = :hospital_id
+              AND start_time >= :from_date
+              AND end_time <= :to_date
+        )
+        SELECT group_key,
+               date_trunc(:period, start_time) AS period,
+               count(*) AS entries,
+               sum(extract(epoch FROM end_time - start_time)) / 3600 AS booked_hours,
+               sum(extract(epoch FROM greatest(
+                   end_time - greatest(start_time, coalesce(covered_until, start_time)),
+                   interval '0'
+               ))) / 3600 AS occupied_hours
+        FROM ordered
+        GROUP BY group_key, period
+        ORDER BY group_key, period
+    """)
+
 # Эндпоинты для работы с расписаниями
 
 @ns.route('')
@@ -189,7 +722,8 @@ class TimetableList(Resource):
     @ns.expect(api.parser().add_argument('hospitalId', type=int, location='args', required=True, help='ID больницы'))
     @ns.expect(api.parser().add_argument('fromDate', type=str, location='args', required=True, help='Дата начала в формате YYYY-MM-DD'))
     @ns.expect(api.parser().add_argument('toDate', type=str, location='args', required=True, help='Дата окончания в формате YYYY-MM-DD'))
-    @ns.marshal_list_with(timetable_model)
+    @ns.expect(api.parser().add_argument('stream', type=str, location='args', choices=tuple(STREAM_FORMATS), help='Потоковая выдача: ndjson или json'))
+    @ns.response(200, 'Success', [timetable_model])
     @ns.response(403, 'Token is missing', model=error_model)
     @ns.response(401, 'Token expired', model=error_model)
     @ns.response(403, 'Token is invalid', model=error_model)
@@ -200,37 +734,20 @@ class TimetableList(Resource):
         parser.add_argument('hospitalId', type=int, location='args', required=True, help='ID больницы')
         parser.add_argument('fromDate', type=str, location='args', required=True, help='Дата начала в формате YYYY-MM-DD')
         parser.add_argument('toDate', type=str, location='args', required=True, help='Дата окончания в формате YYYY-MM-DD')
+        parser.add_argument('stream', type=str, location='args', choices=tuple(STREAM_FORMATS), help='Потоковая выдача: ndjson или json')
         args = parser.parse_args()
         
         hospital_id = args.get('hospitalId')
         from_date_str = args.get('fromDate')
         to_date_str = args.get('toDate')
         
-        try:
-            from_date = datetime.datetime.strptime(from_date_str, "%Y-%m-%d")
-            to_date = datetime.datetime.strptime(to_date_str, "%Y-%m-%d")
-        except ValueError:
-            api.abort(400, 'Invalid date format. Use YYYY-MM-DD', status='fail', statusCode="400")
-        
-        timetables = Timetable.query.filter(
-            Timetable.hospital_id == hospital_id,
-            Timetable.start_time >= from_date,
-            Timetable.end_time <= to_date
-        ).all()
+        from_date, to_date = parse_date_range(from_date_str, to_date_str)
         
-        output = []
-        for t in timetables:
-            timetable_data = {
-                'id': t.id,
-                'hospitalId': t.hospital_id,
-                'doctorId': t.doctor_id,
-                'from': t.start_time.isoformat(),
-                'to': t.end_time.isoformat(),
-                'room': t.room
-            }
-            output.append(timetable_data)
+        if args.get('stream'):
+            return stream_timetables(hospital_timetable_query(hospital_id, from_date, to_date), args.get('stream'))
         
-        return output, 200
+        output = cached_hospital_timetable(hospital_id, from_date, to_date)
+        return responses.marshal(output, timetable_model), 200
     
     @ns.doc('create_timetable')
     @ns.expect(timetable_model, validate=True)
@@ -239,11 +756,15 @@ class TimetableList(Resource):
     @ns.response(403, 'Token is invalid', model=error_model)
     @ns.response(404, 'Doctor not found', model=error_model)
     @ns.response(404, 'Room not found', model=error_model)
+    @ns.response(409, 'Request with this Idempotency-Key is still in progress', model=error_model)
+    @ns.response(422, 'Idempotency-Key was used with a different request', model=error_model)
+    @ns.doc(params={'Idempotency-Key': {'in': 'header', 'type': 'string', 'description': 'Ключ повтора: повторный запрос с тем же ключом получает сохранённый ответ'}})
     @token_required
+    @idempotency.idempotent
     def post(self):
         """Создать запись в расписании"""
         data = request.get_json()
-        logging.debug(f"Received data for timetable creation: {data}")
+        logger.debug("Received data for timetable creation: %s", data)
         
         # Валидация существования врача и комнаты
         if not doctor_exists(data['doctorId']):
@@ -254,9 +775,9 @@ class TimetableList(Resource):
         
         # Создание расписания
         try:
-            start_time = parser.isoparse(data['from'])
-            end_time = parser.isoparse(data['to'])
-            logging.debug(f"Parsed start_time: {start_time}, end_time: {end_time}")
+            start_time = parse_datetime(data['from'])
+            end_time = parse_datetime(data['to'])
+            logger.debug("Parsed start_time: %s, end_time: %s", start_time, end_time)
         except ValueError:
             api.abort(400, 'Invalid datetime format. Use ISO format.', status='fail', statusCode="400")
         
@@ -269,9 +790,10 @@ class TimetableList(Resource):
         )
         
         db.session.add(new_entry)
+        db.session.execute(day_versions_bump([(new_entry.hospital_id, new_entry.start_time.date())]))
         db.session.commit()
         
-        logging.debug(f"Timetable entry created with ID: {new_entry.id}")
+        logger.debug("Timetable entry created with ID: %s", new_entry.id)
         return {'message': 'Timetable entry created successfully'}, 201
 
 @ns.route('/<int:id>')
@@ -291,29 +813,33 @@ class TimetableResource(Resource):
             api.abort(404, 'Timetable not found', status='fail', statusCode="404")
         
         data = request.get_json()
-        logging.debug(f"Received data for timetable update: {data}")
+        logger.debug("Received data for timetable update: %s", data)
+        previous_day = timetable.start_time.date()
         
         if 'from' in data:
             try:
-                timetable.start_time = parser.isoparse(data['from'])
-                logging.debug(f"Updated start_time: {timetable.start_time}")
+                timetable.start_time = parse_datetime(data['from'])
+                logger.debug("Updated start_time: %s", timetable.start_time)
             except ValueError:
                 api.abort(400, 'Invalid from datetime format. Use ISO format.', status='fail', statusCode="400")
         if 'to' in data:
             try:
-                timetable.end_time = parser.isoparse(data['to'])
-                logging.debug(f"Updated end_time: {timetable.end_time}")
+                timetable.end_time = parse_datetime(data['to'])
+                logger.debug("Updated end_time: %s", timetable.end_time)
             except ValueError:
                 api.abort(400, 'Invalid to datetime format. Use ISO format.', status='fail', statusCode="400")
         if 'room' in data:
             if room_exists(timetable.hospital_id, data['room']):
                 timetable.room = data['room']
-                logging.debug(f"Updated room: {timetable.room}")
+                logger.debug("Updated room: %s", timetable.room)
             else:
                 api.abort(404, 'Room not found', status='fail', statusCode="404")
         
+        db.session.execute(day_versions_bump([
+            (timetable.hospital_id, previous_day), (timetable.hospital_id, timetable.start_time.date())
+        ]))
         db.session.commit()
-        logging.debug(f"Timetable entry with ID {id} updated successfully.")
+        logger.debug("Timetable entry with ID %s updated successfully.", id)
         return {'message': 'Timetable updated successfully'}, 200
     
     @ns.doc('delete_timetable')
@@ -328,9 +854,12 @@ class TimetableResource(Resource):
         if not timetable:
             api.abort(404, 'Timetable not found', status='fail', statusCode="404")
         
+        hospital_id = timetable.hospital_id
+        day = timetable.start_time.date()
         db.session.delete(timetable)
+        db.session.execute(day_versions_bump([(hospital_id, day)]))
         db.session.commit()
-        logging.debug(f"Timetable entry with ID {id} deleted successfully.")
+        logger.debug("Timetable entry with ID %s deleted successfully.", id)
         return {'message': 'Timetable entry deleted successfully'}, 200
 
 @ns.route('/Hospital/<int:hospital_id>')
@@ -339,7 +868,8 @@ class HospitalTimetable(Resource):
     @ns.doc('get_hospital_timetable')
     @ns.expect(api.parser().add_argument('fromDate', type=str, location='args', required=True, help='Дата начала в формате YYYY-MM-DD'))
     @ns.expect(api.parser().add_argument('toDate', type=str, location='args', required=True, help='Дата окончания в формате YYYY-MM-DD'))
-    @ns.marshal_list_with(timetable_model)
+    @ns.expect(api.parser().add_argument('stream', type=str, location='args', choices=tuple(STREAM_FORMATS), help='Потоковая выдача: ndjson или json'))
+    @ns.response(200, 'Success', [timetable_model])
     @ns.response(403, 'Token is missing', model=error_model)
     @ns.response(401, 'Token expired', model=error_model)
     @ns.response(403, 'Token is invalid', model=error_model)
@@ -349,37 +879,144 @@ class HospitalTimetable(Resource):
         parser = api.parser()
         parser.add_argument('fromDate', type=str, location='args', required=True, help='Дата начала в формате YYYY-MM-DD')
         parser.add_argument('toDate', type=str, location='args', required=True, help='Дата окончания в формате YYYY-MM-DD')
+        parser.add_argument('stream', type=str, location='args', choices=tuple(STREAM_FORMATS), help='Потоковая выдача: ndjson или json')
         args = parser.parse_args()
         
         from_date_str = args.get('fromDate')
         to_date_str = args.get('toDate')
         
-        try:
-            from_date = datetime.datetime.strptime(from_date_str, "%Y-%m-%d")
-            to_date = datetime.datetime.strptime(to_date_str, "%Y-%m-%d")
-        except ValueError:
-            api.abort(400, 'Invalid date format. Use YYYY-MM-DD', status='fail', statusCode="400")
+        from_date, to_date = parse_date_range(from_date_str, to_date_str)
         
-        timetables = Timetable.query.filter(
-            Timetable.hospital_id == hospital_id,
-            Timetable.start_time >= from_date,
-            Timetable.end_time <= to_date
-        ).all()
+        if args.get('stream'):
+            return stream_timetables(hospital_timetable_query(hospital_id, from_date, to_date), args.get('stream'))
         
-        output = []
-        for t in timetables:
-            timetable_data = {
-                'id': t.id,
-                'hospitalId': t.hospital_id,
-                'doctorId': t.doctor_id,
-                'from': t.start_time.isoformat(),
-                'to': t.end_time.isoformat(),
-                'room': t.room
-            }
-            output.append(timetable_data)
+        output = cached_hospital_timetable(hospital_id, from_date, to_date)
+        return responses.marshal(output, timetable_model), 200
+    
+    @ns.doc('delete_hospital_timetable')
+    @ns.expect(api.parser().add_argument('fromDate', type=str, location='args', help='Дата начала в формате YYYY-MM-DD'))
+    @ns.expect(api.parser().add_argument('toDate', type=str, location='args', help='Дата окончания в формате YYYY-MM-DD'))
+    @ns.expect(api.parser().add_argument('archive', type=inputs.boolean, location='args', default=False, help='Перенести записи в архив вместо удаления'))
+    @ns.expect(api.parser().add_argument('background', type=inputs.boolean, location='args', default=False, help='Выполнить в фоне и сразу вернуть задачу'))
+    @ns.response(200, 'Success', cleanup_result_model)
+    @ns.response(202, 'Cleanup scheduled', job_model)
+    @ns.response(400, 'Invalid date format', model=error_model)
+    @ns.response(403, 'Permission denied', model=error_model)
+    @admin_required
+    def delete(self, hospital_id):
+        """Удалить или архивировать все записи расписания больницы (при указании периода — только за период)"""
+        parser = api.parser()
+        parser.add_argument('fromDate', type=str, location='args', help='Дата начала в формате YYYY-MM-DD')
+        parser.add_argument('toDate', type=str, location='args', help='Дата окончания в формате YYYY-MM-DD')
+        parser.add_argument('archive', type=inputs.boolean, location='args', default=False, help='Перенести записи в архив вместо удаления')
+        parser.add_argument('background', type=inputs.boolean, location='args', default=False, help='Выполнить в фоне и сразу вернуть задачу')
+        args = parser.parse_args()
+        
+        params = {'hospitalId': hospital_id, 'fromDate': args.get('fromDate'), 'toDate': args.get('toDate'), 'archive': args.get('archive')}
+        conditions = timetable_purge_conditions(params)
+        if args.get('background'):
+            job = jobs.submit('timetable_purge', params)
+            return marshal(job, job_model), 202, {'Location': f'/api/Jobs/{job["jobId"]}'}
+        
+        affected = purge_timetables(conditions, archive=args.get('archive'))
+        logger.info("Removed %s timetable entries of hospital %s.", affected, hospital_id)
+        return marshal({'message': 'Hospital timetable entries removed successfully', 'affected': affected, 'archived': args.get('archive')}, cleanup_result_model), 200
+
+@ns.route('/Doctor/<int:doctor_id>')
+@ns.param('doctor_id', 'Уникальный идентификатор врача')
+class DoctorTimetable(Resource):
+    @ns.doc('delete_doctor_timetable')
+    @ns.expect(api.parser().add_argument('archive', type=inputs.boolean, location='args', default=False, help='Перенести записи в архив вместо удаления'))
+    @ns.expect(api.parser().add_argument('background', type=inputs.boolean, location='args', default=False, help='Выполнить в фоне и сразу вернуть задачу'))
+    @ns.response(200, 'Success', cleanup_result_model)
+    @ns.response(202, 'Cleanup scheduled', job_model)
+    @ns.response(403, 'Permission denied', model=error_model)
+    @admin_required
+    def delete(self, doctor_id):
+        """Удалить или архивировать все записи расписания врача"""
+        parser = api.parser()
+        parser.add_argument('archive', type=inputs.boolean, location='args', default=False, help='Перенести записи в архив вместо удаления')
+        parser.add_argument('background', type=inputs.boolean, location='args', default=False, help='Выполнить в фоне и сразу вернуть задачу')
+        args = parser.parse_args()
+        
+        if args.get('background'):
+            job = jobs.submit('timetable_purge', {'doctorId': doctor_id, 'archive': args.get('archive')})
+            return marshal(job, job_model), 202, {'Location': f'/api/Jobs/{job["jobId"]}'}
         
+        affected = purge_timetables([Timetable.doctor_id == doctor_id], archive=args.get('archive'))
+        logger.info("Removed %s timetable entries of doctor %s.", affected, doctor_id)
+        return marshal({'message': 'Doctor timetable entries removed successfully', 'affected': affected, 'archived': args.get('archive')}, cleanup_result_model), 200
+
+@ns.route('/Hospital/<int:hospital_id>/Utilization')
+@ns.param('hospital_id', 'Уникальный идентификатор больницы')
+class HospitalUtilization(Resource):
+    @ns.doc('get_hospital_utilization')
+    @ns.expect(api.parser().add_argument('fromDate', type=str, location='args', required=True, help='Дата начала в формате YYYY-MM-DD'))
+    @ns.expect(api.parser().add_argument('toDate', type=str, location='args', required=True, help='Дата окончания в формате YYYY-MM-DD'))
+    @ns.expect(api.parser().add_argument('groupBy', type=str, location='args', choices=tuple(UTILIZATION_GROUPS), default='room', help='Группировка: room или doctor'))
+    @ns.expect(api.parser().add_argument('period', type=str, location='args', choices=UTILIZATION_PERIODS, default='day', help='Период: day или week'))
+    @responses.marshal_with(ns, utilization_model, as_list=True)
+    @ns.response(403, 'Token is missing', model=error_model)
+    @ns.response(401, 'Token expired', model=error_model)
+    @ns.response(403, 'Token is invalid', model=error_model)
+    @token_required
+    def get(self, hospital_id):
+        """Получить загрузку кабинетов или врачей больницы по дням или неделям"""
+        parser = api.parser()
+        parser.add_argument('fromDate', type=str, location='args', required=True, help='Дата начала в формате YYYY-MM-DD')
+        parser.add_argument('toDate', type=str, location='args', required=True, help='Дата окончания в формате YYYY-MM-DD')
+        parser.add_argument('groupBy', type=str, location='args', choices=tuple(UTILIZATION_GROUPS), default='room', help='Группировка: room или doctor')
+        parser.add_argument('period', type=str, location='args', choices=UTILIZATION_PERIODS, default='day', help='Период: day или week')
+        args = parser.parse_args()
+        
+        from_date, to_date = parse_date_range(args.get('fromDate'), args.get('toDate'))
+        group_by = args.get('groupBy')
+        
+        rows = db.session.execute(utilization_sql(group_by), {
+            'hospital_id': hospital_id,
+            'from_date': from_date,
+            'to_date': to_date,
+            'period': args.get('period')
+        })
+        
+        output = []
+        for row in rows:
+            output.append({
+                'room': row.group_key if group_by == 'room' else None,
+                'doctorId': row.group_key if group_by == 'doctor' else None,
+                'period': row.period.date().isoformat(),
+                'entries': row.entries,
+                'bookedHours': float(row.booked_hours),
+                'occupiedHours': float(row.occupied_hours)
+            })
         return output, 200
 
-if __name__ == '__main__':
+@ns.route('/Cache')
+class TimetableCacheStats(Resource):
+    @ns.doc('get_timetable_cache_stats')
+    @ns.marshal_with(cache_stats_model)
+    @ns.response(403, 'Token is missing', model=error_model)
+    @ns.response(403, 'Token is invalid', model=error_model)
+    @token_required
+    def get(self):
+        """Получить статистику кэша расписаний"""
+        return timetable_cache.stats(), 200
+
+@serving.on_startup
+def prepare_database():
     db.create_all()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # create_all не добавляет индексы к уже существующей таблице
+    for index in Timetable.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+
+# Поток QueueListener, запущенный при импорте, после fork остаётся только в мастере
+@serving.on_worker_start
+def restart_log_listener():
+    if log_listener and log_listener_pid != os.getpid():
+        start_log_listener(log_listener.queue, *log_listener.handlers)
+
+serving.on_worker_start(jobs.start)
+serving.on_worker_exit(jobs.stop)
+
+if __name__ == '__main__':
+    serving.run_dev_server(app)